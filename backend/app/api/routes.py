@@ -1,9 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from sqlalchemy.orm import Session
-from app.database import get_db
-from app.schemas import UserResponse, UserUpdate, UserProfileResponse, UserListResponse
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db, get_read_db
+from app.schemas import (
+    UserResponse, UserUpdate, UserProfileResponse, UserListResponse,
+    PresenceRequest, PresenceResponse
+)
 from app.models import User
 from app.auth.security import get_current_active_user
+from app.redis_client import get_users_presence
+from app.serialization import FastJSONResponse, model_fields, row_to_dict
 from typing import List
 import boto3
 from app.config import settings
@@ -11,6 +17,9 @@ import uuid
 
 router = APIRouter()
 
+# Fields of UserResponse, selected as columns for user lists
+USER_FIELDS = model_fields(UserResponse)
+
 # Get current user profile
 @router.get("/users/me", response_model=UserProfileResponse)
 async def get_current_user_profile(current_user: User = Depends(get_current_active_user)):
@@ -20,15 +29,15 @@ async def get_current_user_profile(current_user: User = Depends(get_current_acti
 @router.put("/users/me", response_model=UserProfileResponse)
 async def update_current_user_profile(
     user_update: UserUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     # Update user fields
     for field, value in user_update.dict(exclude_unset=True).items():
         setattr(current_user, field, value)
     
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
     
     return current_user
 
@@ -36,7 +45,7 @@ async def update_current_user_profile(
 @router.post("/users/me/upload-profile-picture", response_model=UserProfileResponse)
 async def upload_profile_picture(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     # Check file type
@@ -73,8 +82,8 @@ async def upload_profile_picture(
         
         # Update user profile picture
         current_user.profile_picture = file_url
-        db.commit()
-        db.refresh(current_user)
+        await db.commit()
+        await db.refresh(current_user)
         
         return current_user
     
@@ -84,27 +93,47 @@ async def upload_profile_picture(
             detail=f"Error uploading file: {str(e)}"
         )
 
-# Get all users
+# Get all users (the total is counted only when asked for)
 @router.get("/users", response_model=UserListResponse)
 async def get_all_users(
     skip: int = 0,
     limit: int = 10,
-    db: Session = Depends(get_db),
+    include_total: bool = False,
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    users = db.query(User).offset(skip).limit(limit).all()
-    total = db.query(User).count()
+    result = await db.execute(
+        select(*[getattr(User, field) for field in USER_FIELDS]).offset(skip).limit(limit)
+    )
+    users = [row_to_dict(row, USER_FIELDS) for row in result]
+    total = await db.scalar(select(func.count()).select_from(User)) if include_total else None
     
-    return {"users": users, "total": total}
+    return FastJSONResponse({"users": users, "total": total})
+
+# Get online status for a batch of users (e.g. a contact list) in one lookup
+@router.post("/users/presence", response_model=PresenceResponse)
+async def get_presence(
+    presence_request: PresenceRequest,
+    current_user: User = Depends(get_current_active_user)
+):
+    user_ids = list(dict.fromkeys(presence_request.user_ids))
+    try:
+        return {"presence": await get_users_presence(user_ids)}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Presence lookup failed: {str(e)}"
+        )
 
 # Get user by ID
 @router.get("/users/{user_id}", response_model=UserResponse)
 async def get_user_by_id(
     user_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    user = db.query(User).filter(User.id == user_id).first()
+    result = await db.execute(select(User).filter(User.id == user_id))
+    user = result.scalars().first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Form
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db
 from app.schemas import (
     UserCreate, UserLogin, Token, OTPRequest, 
@@ -27,10 +28,11 @@ def is_email(contact: str) -> bool:
 
 # Register new user
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def register(user_data: UserCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
     # Check if user already exists
     if user_data.email:
-        existing_user = db.query(User).filter(User.email == user_data.email).first()
+        result = await db.execute(select(User).filter(User.email == user_data.email))
+        existing_user = result.scalars().first()
         if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -38,7 +40,8 @@ async def register(user_data: UserCreate, background_tasks: BackgroundTasks, db:
             )
     
     if user_data.phone_number:
-        existing_user = db.query(User).filter(User.phone_number == user_data.phone_number).first()
+        result = await db.execute(select(User).filter(User.phone_number == user_data.phone_number))
+        existing_user = result.scalars().first()
         if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -58,8 +61,8 @@ async def register(user_data: UserCreate, background_tasks: BackgroundTasks, db:
     )
     
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     
     # Automatically send OTP after registration
     try:
@@ -79,16 +82,18 @@ async def register(user_data: UserCreate, background_tasks: BackgroundTasks, db:
 @router.post("/login", response_model=Token)
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # Check if username is email or phone number
     username = form_data.username
     password = form_data.password
     
     if is_email(username):
-        user = db.query(User).filter(User.email == username).first()
+        result = await db.execute(select(User).filter(User.email == username))
+        user = result.scalars().first()
     else:
-        user = db.query(User).filter(User.phone_number == username).first()
+        result = await db.execute(select(User).filter(User.phone_number == username))
+        user = result.scalars().first()
     
     if not user:
         raise HTTPException(
@@ -122,15 +127,17 @@ async def login(
 
 # Send OTP
 @router.post("/send-otp", status_code=status.HTTP_200_OK)
-async def send_otp(otp_request: OTPRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+async def send_otp(otp_request: OTPRequest, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
     contact = otp_request.contact
     contact_type = otp_request.contact_type
     
     # Find user by contact
     if contact_type == "email":
-        user = db.query(User).filter(User.email == contact).first()
+        result = await db.execute(select(User).filter(User.email == contact))
+        user = result.scalars().first()
     else:
-        user = db.query(User).filter(User.phone_number == contact).first()
+        result = await db.execute(select(User).filter(User.phone_number == contact))
+        user = result.scalars().first()
     
     if not user:
         raise HTTPException(
@@ -163,15 +170,17 @@ async def send_otp(otp_request: OTPRequest, background_tasks: BackgroundTasks, d
 
 # Verify OTP
 @router.post("/verify-otp", status_code=status.HTTP_200_OK)
-async def verify_otp(otp_verify: OTPVerify, db: Session = Depends(get_db)):
+async def verify_otp(otp_verify: OTPVerify, db: AsyncSession = Depends(get_db)):
     contact = otp_verify.contact
     otp = otp_verify.otp
     
     # Find user by contact
     if is_email(contact):
-        user = db.query(User).filter(User.email == contact).first()
+        result = await db.execute(select(User).filter(User.email == contact))
+        user = result.scalars().first()
     else:
-        user = db.query(User).filter(User.phone_number == contact).first()
+        result = await db.execute(select(User).filter(User.phone_number == contact))
+        user = result.scalars().first()
     
     if not user:
         raise HTTPException(
@@ -196,7 +205,7 @@ async def verify_otp(otp_verify: OTPVerify, db: Session = Depends(get_db)):
     
     # Mark user as verified
     user.is_verified = True
-    db.commit()
+    await db.commit()
     
     # Delete OTP from Redis
     delete_otp(user.id)
@@ -217,15 +226,17 @@ async def verify_otp(otp_verify: OTPVerify, db: Session = Depends(get_db)):
 
 # Reset password
 @router.post("/reset-password", status_code=status.HTTP_200_OK)
-async def reset_password(reset_data: PasswordReset, db: Session = Depends(get_db)):
+async def reset_password(reset_data: PasswordReset, db: AsyncSession = Depends(get_db)):
     contact = reset_data.contact
     otp = reset_data.otp
     
     # Find user by contact
     if is_email(contact):
-        user = db.query(User).filter(User.email == contact).first()
+        result = await db.execute(select(User).filter(User.email == contact))
+        user = result.scalars().first()
     else:
-        user = db.query(User).filter(User.phone_number == contact).first()
+        result = await db.execute(select(User).filter(User.phone_number == contact))
+        user = result.scalars().first()
     
     if not user:
         raise HTTPException(
@@ -244,7 +255,7 @@ async def reset_password(reset_data: PasswordReset, db: Session = Depends(get_db
     
     # Update password
     user.hashed_password = get_password_hash(reset_data.new_password)
-    db.commit()
+    await db.commit()
     
     # Delete OTP from Redis
     delete_otp(user.id)
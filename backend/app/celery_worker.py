@@ -27,6 +27,12 @@ def get_celery_app():
                 task_track_started=True,
                 worker_max_tasks_per_child=1000,
             )
+            
+            # Periodic tasks (run with `celery -A app.celery_worker beat`)
+            if settings.ARCHIVE_AFTER_DAYS > 0:
+                celery_app.conf.beat_schedule = {
+                    "archive-messages": {"task": "archive_messages", "schedule": 3600.0}
+                }
         except Exception as e:
             print(f"Celery connection error: {e}")
             return None
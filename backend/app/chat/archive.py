@@ -0,0 +1,233 @@
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models import (
+    Message, MessageStatus, MessageType, ArchiveSegment,
+    direct_conversation_id, group_conversation_id
+)
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import gzip
+import json
+import os
+
+# Cold message archive
+#
+# Messages older than ARCHIVE_AFTER_DAYS are moved out of the messages table
+# into segments: gzip NDJSON files of at most ARCHIVE_SEGMENT_MESSAGES
+# messages of one conversation from one month, listed in the archive_segments
+# table. Each run first fills the last segment of a month if it is not full,
+# then starts new ones. A listed file never changes: filling a segment writes
+# a new file (to a temporary name that is fsynced and renamed into place),
+# and the index row is repointed and the messages deleted in one
+# transaction, after which the old file is removed. If a run dies in
+# between, the index still lists the old files, the messages are still hot
+# and the next run writes the same segments again; readers never see a
+# partial file.
+#
+# A position in a conversation, as used by keyset pagination
+Position = Tuple[datetime, str]
+
+# Conversation key of a message, as used by watermarks and the conversations read-model
+def archive_conversation_id(message: Message) -> str:
+    if message.group_id:
+        return group_conversation_id(message.group_id)
+    return message.conversation_id or direct_conversation_id(message.sender_id, message.receiver_id)
+
+# The message count is part of the name, so a filled segment gets a new file
+def segment_path(conversation_id: str, month: str, seq: int, message_count: int) -> str:
+    return os.path.join(
+        conversation_id.replace(":", "_"), f"{month}-{seq:04d}-{message_count:04d}.ndjson.gz"
+    )
+
+def serialize_message(message: Message) -> dict:
+    return {
+        "id": message.id,
+        "sender_id": message.sender_id,
+        "receiver_id": message.receiver_id,
+        "group_id": message.group_id,
+        "conversation_id": message.conversation_id,
+        "content": message.content,
+        "message_type": message.message_type.value if message.message_type else None,
+        "file_url": message.file_url,
+        "status": message.status.value if message.status else None,
+        "is_deleted": bool(message.is_deleted),
+        "created_at": message.created_at.isoformat(),
+        "updated_at": message.updated_at.isoformat() if message.updated_at else None
+    }
+
+# Rebuild a (detached, never added to a session) Message from an archived record
+def deserialize_message(record: dict) -> Message:
+    return Message(
+        **{
+            **record,
+            "message_type": MessageType(record["message_type"]) if record["message_type"] else None,
+            "status": MessageStatus(record["status"]) if record["status"] else None,
+            "created_at": datetime.fromisoformat(record["created_at"]),
+            "updated_at": datetime.fromisoformat(record["updated_at"]) if record["updated_at"] else None
+        }
+    )
+
+# Write a segment file atomically (temporary file, fsync, rename)
+def write_segment(path: str, records: List[dict]):
+    full_path = os.path.join(settings.ARCHIVE_DIR, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    payload = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+    temporary_path = full_path + ".tmp"
+    with open(temporary_path, "wb") as segment_file:
+        segment_file.write(gzip.compress(payload.encode()))
+        segment_file.flush()
+        os.fsync(segment_file.fileno())
+    os.replace(temporary_path, full_path)
+
+# Move every message created before the cutoff into the archive
+#
+# Runs on the sync engine (from the CLI or a Celery task). Returns the number
+# of messages archived.
+def archive_messages(
+    db: Session, cutoff: datetime, batch_size: int = 5000, segment_messages: int = 1000
+) -> int:
+    archived = 0
+    while True:
+        messages = db.execute(
+            select(Message)
+            .filter(Message.created_at < cutoff)
+            .order_by(Message.created_at, Message.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not messages:
+            return archived
+
+        months: Dict[Tuple[str, str], List[dict]] = defaultdict(list)
+        for message in messages:
+            key = (archive_conversation_id(message), message.created_at.strftime("%Y-%m"))
+            months[key].append(serialize_message(message))
+
+        # Files of the segments filled in this batch, removed once the index points past them
+        replaced_paths: List[str] = []
+        for (conversation_id, month), records in months.items():
+            last_segment = db.execute(
+                select(ArchiveSegment)
+                .filter(ArchiveSegment.conversation_id == conversation_id, ArchiveSegment.month == month)
+                .order_by(ArchiveSegment.seq.desc())
+                .limit(1)
+            ).scalar_one_or_none()
+            open_segment = None
+            seq = 0
+            if last_segment is not None and last_segment.message_count < segment_messages:
+                open_segment = last_segment
+                seq = last_segment.seq
+                records = read_records(last_segment.path) + records
+                records.sort(key=lambda record: (record["created_at"], record["id"]))
+            elif last_segment is not None:
+                seq = last_segment.seq + 1
+
+            for start in range(0, len(records), segment_messages):
+                chunk = records[start:start + segment_messages]
+                path = segment_path(conversation_id, month, seq, len(chunk))
+                write_segment(path, chunk)
+                first_at = datetime.fromisoformat(chunk[0]["created_at"])
+                last_at = datetime.fromisoformat(chunk[-1]["created_at"])
+                if start == 0 and open_segment is not None:
+                    replaced_paths.append(open_segment.path)
+                    open_segment.path = path
+                    open_segment.message_count = len(chunk)
+                    open_segment.first_at = first_at
+                    open_segment.last_at = last_at
+                else:
+                    db.add(ArchiveSegment(
+                        conversation_id=conversation_id,
+                        month=month,
+                        seq=seq,
+                        path=path,
+                        message_count=len(chunk),
+                        first_at=first_at,
+                        last_at=last_at
+                    ))
+                seq += 1
+
+        db.execute(delete(Message).where(Message.id.in_([message.id for message in messages])))
+        db.commit()
+        for path in replaced_paths:
+            segment_cache.pop(path, None)
+            try:
+                os.remove(os.path.join(settings.ARCHIVE_DIR, path))
+            except FileNotFoundError:
+                pass
+        archived += len(messages)
+        print(f"Archived {archived} messages")
+
+# Archive everything older than ARCHIVE_AFTER_DAYS (no-op when archiving is disabled)
+def run_archive() -> int:
+    if settings.ARCHIVE_AFTER_DAYS <= 0:
+        return 0
+    from app.database import SessionLocal
+    cutoff = datetime.utcnow() - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+    with SessionLocal() as db:
+        return archive_messages(db, cutoff, settings.ARCHIVE_BATCH_SIZE, settings.ARCHIVE_SEGMENT_MESSAGES)
+
+# Decoded segments, keyed by path (segment files never change once listed)
+segment_cache: "OrderedDict[str, List[Message]]" = OrderedDict()
+
+def read_records(path: str) -> List[dict]:
+    with open(os.path.join(settings.ARCHIVE_DIR, path), "rb") as segment_file:
+        payload = gzip.decompress(segment_file.read())
+    return [json.loads(line) for line in payload.splitlines()]
+
+def read_segment(path: str) -> List[Message]:
+    return [deserialize_message(record) for record in read_records(path)]
+
+async def load_segment(segment: ArchiveSegment) -> List[Message]:
+    messages = segment_cache.get(segment.path)
+    if messages is not None:
+        segment_cache.move_to_end(segment.path)
+        return messages
+    messages = await asyncio.to_thread(read_segment, segment.path)
+    segment_cache[segment.path] = messages
+    while len(segment_cache) > settings.ARCHIVE_CACHE_SEGMENTS:
+        segment_cache.popitem(last=False)
+    return messages
+
+# Read archived messages of a conversation next to a position
+#
+# With before, returns up to limit messages older than it, newest first
+# (before=None starts from the newest archived message). With after, returns
+# up to limit messages newer than it, oldest first.
+async def read_archived_messages(
+    db: AsyncSession,
+    conversation_id: str,
+    limit: int,
+    before: Optional[Position] = None,
+    after: Optional[Position] = None
+) -> List[Message]:
+    query = select(ArchiveSegment).filter(ArchiveSegment.conversation_id == conversation_id)
+    if after is not None:
+        query = query.filter(ArchiveSegment.last_at >= after[0]).order_by(
+            ArchiveSegment.month.asc(), ArchiveSegment.seq.asc()
+        )
+    else:
+        if before is not None:
+            query = query.filter(ArchiveSegment.first_at <= before[0])
+        query = query.order_by(ArchiveSegment.month.desc(), ArchiveSegment.seq.desc())
+    result = await db.execute(query)
+
+    messages: List[Message] = []
+    for segment in result.scalars():
+        segment_messages = await load_segment(segment)
+        if after is not None:
+            messages.extend(m for m in segment_messages if (m.created_at, m.id) > after)
+        else:
+            messages.extend(
+                m for m in reversed(segment_messages)
+                if before is None or (m.created_at, m.id) < before
+            )
+        if len(messages) >= limit:
+            break
+    return messages[:limit]
+
+if __name__ == "__main__":
+    # python -m app.chat.archive
+    print(f"Archived {run_archive()} messages in total")
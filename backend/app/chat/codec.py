@@ -0,0 +1,71 @@
+from fastapi import WebSocket
+from typing import Dict, Optional, Tuple, Union
+import json
+
+try:
+    import msgpack
+except ImportError:  # MessagePack support is optional
+    msgpack = None
+
+# Wire codecs for /chat/ws
+#
+# Clients pick a codec by offering WebSocket subprotocols at connect time
+# (Sec-WebSocket-Protocol). Clients that offer none get JSON text frames,
+# which is the original protocol. Every event type goes through the same
+# codec in both directions.
+
+class JsonCodec:
+    name = "json"
+    subprotocol = "chat.json"
+
+    def encode(self, message: dict) -> str:
+        return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+    def decode(self, data: Union[str, bytes]) -> dict:
+        return json.loads(data)
+
+class MsgPackCodec:
+    name = "msgpack"
+    subprotocol = "chat.msgpack"
+
+    def encode(self, message: dict) -> bytes:
+        return msgpack.packb(message, use_bin_type=True)
+
+    def decode(self, data: Union[str, bytes]) -> dict:
+        if isinstance(data, str):
+            # Tolerate JSON text frames from clients that only encode binary payloads
+            return json.loads(data)
+        return msgpack.unpackb(data, raw=False)
+
+json_codec = JsonCodec()
+
+# Codecs available on this server, by subprotocol name
+CODECS = {json_codec.subprotocol: json_codec}
+if msgpack is not None:
+    CODECS[MsgPackCodec.subprotocol] = MsgPackCodec()
+
+# Choose the first subprotocol offered by the client that we support
+def negotiate_codec(websocket: WebSocket) -> Tuple[object, Optional[str]]:
+    for subprotocol in websocket.scope.get("subprotocols", []):
+        codec = CODECS.get(subprotocol)
+        if codec is not None:
+            return codec, subprotocol
+    return json_codec, None
+
+# A message encoded lazily, at most once per codec
+#
+# Used when one message goes to many sessions that may speak different codecs.
+class EncodedFrames:
+    def __init__(self, message: Optional[dict] = None, json_frame: Optional[str] = None):
+        self.message = message
+        self.frames: Dict[str, Union[str, bytes]] = {}
+        if json_frame is not None:
+            self.frames[json_codec.name] = json_frame
+
+    def get(self, codec) -> Union[str, bytes]:
+        frame = self.frames.get(codec.name)
+        if frame is None:
+            if self.message is None:
+                self.message = json_codec.decode(self.frames[json_codec.name])
+            frame = self.frames[codec.name] = codec.encode(self.message)
+        return frame
@@ -0,0 +1,130 @@
+from sqlalchemy import select, update, insert, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import Conversation, Message, GroupDeliveryMode, direct_conversation_id, group_conversation_id
+from app.chat.membership import membership_cache
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, List
+
+# Characters of the last message kept for the inbox preview
+PREVIEW_LENGTH = 255
+
+# Conversation key of a message row (as built by the WebSocket endpoint)
+def message_conversation_id(row: dict) -> str:
+    if row.get("group_id"):
+        return group_conversation_id(row["group_id"])
+    return row.get("conversation_id") or direct_conversation_id(row["sender_id"], row["receiver_id"])
+
+# Filter selecting the messages of a conversation, by its key
+def conversation_filter(conversation_id: str):
+    if conversation_id.startswith("group:"):
+        return Message.group_id == conversation_id.split(":", 1)[1]
+    return Message.conversation_id == conversation_id
+
+# Update the inbox rows of every participant for newly written messages
+#
+# Runs in the caller's transaction (the caller commits). Rows are grouped by
+# conversation so a batch costs a handful of statements per conversation,
+# not per message. Rows that do not exist yet are inserted, ignoring
+# duplicates from a concurrent writer.
+async def record_messages(db: AsyncSession, rows: List[dict]):
+    by_conversation: Dict[str, List[dict]] = defaultdict(list)
+    for row in rows:
+        by_conversation[message_conversation_id(row)].append(row)
+
+    for conversation_id, messages in by_conversation.items():
+        first = messages[0]
+        if first.get("group_id"):
+            group = await membership_cache.get_group(first["group_id"])
+            if group is None or group[1] == GroupDeliveryMode.CHANNEL:
+                # Channel groups keep no per-member inbox rows
+                continue
+            participants = list(group[0])
+        else:
+            participants = list(dict.fromkeys([first["sender_id"], first["receiver_id"]]))
+        if not participants:
+            continue
+
+        latest = max(messages, key=lambda row: (row["created_at"], row["id"]))
+        last_message = {
+            "last_message_id": latest["id"],
+            "last_sender_id": latest["sender_id"],
+            "last_message_preview": latest["content"][:PREVIEW_LENGTH],
+            "last_message_at": latest["created_at"]
+        }
+        sent = Counter(row["sender_id"] for row in messages)
+
+        result = await db.execute(
+            select(Conversation.user_id).filter(
+                Conversation.conversation_id == conversation_id,
+                Conversation.user_id.in_(participants)
+            )
+        )
+        existing = set(result.scalars())
+
+        if existing:
+            # Only move the last message forward
+            await db.execute(
+                update(Conversation)
+                .filter(
+                    Conversation.conversation_id == conversation_id,
+                    Conversation.user_id.in_(existing),
+                    (Conversation.last_message_at.is_(None)) | (Conversation.last_message_at <= latest["created_at"])
+                )
+                .values(**last_message)
+            )
+
+            # Everyone gets the messages they did not send as unread, one statement per distinct increment
+            increments = defaultdict(list)
+            for user_id in existing:
+                unread = len(messages) - sent[user_id]
+                if unread:
+                    increments[unread].append(user_id)
+            for unread, user_ids in increments.items():
+                await db.execute(
+                    update(Conversation)
+                    .filter(
+                        Conversation.conversation_id == conversation_id,
+                        Conversation.user_id.in_(user_ids)
+                    )
+                    .values(unread_count=Conversation.unread_count + unread)
+                )
+
+        new_rows = [
+            {
+                "user_id": user_id,
+                "conversation_id": conversation_id,
+                "peer_id": None if first.get("group_id") else (
+                    first["receiver_id"] if user_id == first["sender_id"] else first["sender_id"]
+                ),
+                "group_id": first.get("group_id"),
+                "unread_count": len(messages) - sent[user_id],
+                **last_message
+            }
+            for user_id in participants if user_id not in existing
+        ]
+        if new_rows:
+            await db.execute(
+                insert(Conversation)
+                .prefix_with("OR IGNORE", dialect="sqlite")
+                .prefix_with("IGNORE", dialect="mysql"),
+                new_rows
+            )
+
+# Recount a user's unread messages after their read watermark moved (the caller commits)
+async def refresh_unread_count(db: AsyncSession, user_id: str, conversation_id: str, read_up_to: datetime):
+    unread = (
+        select(func.count())
+        .select_from(Message)
+        .filter(
+            conversation_filter(conversation_id),
+            Message.created_at > read_up_to,
+            Message.sender_id != user_id
+        )
+        .scalar_subquery()
+    )
+    await db.execute(
+        update(Conversation)
+        .filter(Conversation.user_id == user_id, Conversation.conversation_id == conversation_id)
+        .values(unread_count=unread)
+    )
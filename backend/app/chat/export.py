@@ -0,0 +1,172 @@
+from sqlalchemy import select, insert, func
+from app.database import AsyncSessionLocal, ReadSessionLocal
+from app.models import Message, MessageStatus, MessageType, ArchiveSegment, direct_conversation_id, new_message_id
+from app.chat.archive import read_segment, serialize_message
+from app.chat.conversations import conversation_filter, record_messages, message_conversation_id
+from app.chat.receipts import advance_watermark
+from app.chat.membership import membership_cache
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+import asyncio
+import json
+
+# Bulk export and import of conversations as NDJSON
+#
+# One message per line, in the same format as archive segments. Exports read
+# the archived months first, then stream the hot rows through a server-side
+# cursor, so memory stays flat however long the conversation is. Imports
+# insert in large executemany batches without loading ORM objects.
+#
+# Imported rows go into the hot table, and history paging relies on every hot
+# message of a conversation being newer than all of its archived ones. Rows
+# created at or before the newest archived message of their conversation are
+# therefore skipped (and counted in the output), not imported.
+
+# Rows fetched per round trip while exporting
+EXPORT_BATCH_SIZE = 5000
+# Rows per INSERT while importing
+IMPORT_BATCH_SIZE = 10000
+
+def to_ndjson(records: Iterable) -> bytes:
+    return "".join(
+        json.dumps(serialize_message(record), separators=(",", ":"), ensure_ascii=False) + "\n"
+        for record in records
+    ).encode()
+
+# Query for every hot message of a conversation, oldest first, as plain rows
+def conversation_messages_query(conversation_id: str):
+    return (
+        select(*Message.__table__.columns)
+        .filter(conversation_filter(conversation_id))
+        .order_by(Message.created_at, Message.id)
+    )
+
+# Stream a conversation as NDJSON chunks (archived months, then hot rows)
+async def iter_conversation_ndjson(conversation_id: str) -> AsyncIterator[bytes]:
+    # The generator outlives the request's dependencies, so it opens its own session
+    async with ReadSessionLocal() as db:
+        result = await db.execute(
+            select(ArchiveSegment.path)
+            .filter(ArchiveSegment.conversation_id == conversation_id)
+            .order_by(ArchiveSegment.month, ArchiveSegment.seq)
+        )
+        for path in result.scalars().all():
+            yield to_ndjson(await asyncio.to_thread(read_segment, path))
+
+        stream = await db.stream(
+            conversation_messages_query(conversation_id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        async for rows in stream.partitions():
+            yield to_ndjson(rows)
+
+# Whether a user may export a conversation (a participant of a direct one, a member of a group)
+async def can_export(user_id: str, conversation_id: str) -> bool:
+    kind, _, rest = conversation_id.partition(":")
+    if kind == "dm":
+        return user_id in rest.split(":")
+    if kind == "group":
+        members = await membership_cache.get_members(rest)
+        return members is not None and user_id in members
+    return False
+
+# Turn one NDJSON record into a row for insert(Message)
+def parse_record(record: dict) -> dict:
+    row = {
+        "id": record.get("id") or new_message_id(),
+        "sender_id": record["sender_id"],
+        "receiver_id": record.get("receiver_id"),
+        "group_id": record.get("group_id"),
+        "conversation_id": None,
+        "content": record["content"],
+        "message_type": MessageType(record.get("message_type") or MessageType.TEXT.value),
+        "file_url": record.get("file_url"),
+        "status": MessageStatus(record.get("status") or MessageStatus.SENT.value),
+        "is_deleted": bool(record.get("is_deleted", False)),
+        "created_at": datetime.fromisoformat(record["created_at"]) if record.get("created_at") else datetime.utcnow(),
+        "updated_at": datetime.fromisoformat(record["updated_at"]) if record.get("updated_at") else None
+    }
+    if row["receiver_id"] and not row["group_id"]:
+        row["conversation_id"] = direct_conversation_id(row["sender_id"], row["receiver_id"])
+    return row
+
+# Creation time of the newest archived message of a conversation (None if nothing is archived)
+async def archived_up_to(conversation_id: str) -> Optional[datetime]:
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(
+            select(func.max(ArchiveSegment.last_at)).filter(ArchiveSegment.conversation_id == conversation_id)
+        )
+
+# Import NDJSON lines in batches; returns the number of messages written
+#
+# Each batch is one executemany INSERT plus the conversations read-model
+# update, in one transaction. With mark_read, every participant's watermark
+# is moved to the newest imported message, so onboarding history does not
+# show up as unread.
+async def import_messages(lines: Iterable[str], batch_size: int = IMPORT_BATCH_SIZE, mark_read: bool = True) -> int:
+    imported = 0
+    skipped = 0
+    newest: Dict[str, dict] = {}
+    archive_boundaries: Dict[str, Optional[datetime]] = {}
+
+    async def write(batch: List[dict]):
+        async with AsyncSessionLocal() as db:
+            await db.execute(insert(Message), batch)
+            await record_messages(db, batch)
+            await db.commit()
+
+    batch = []
+    for line in lines:
+        if not line.strip():
+            continue
+        row = parse_record(json.loads(line))
+        conversation_id = message_conversation_id(row)
+        if conversation_id not in archive_boundaries:
+            archive_boundaries[conversation_id] = await archived_up_to(conversation_id)
+        boundary = archive_boundaries[conversation_id]
+        if boundary is not None and row["created_at"] <= boundary:
+            skipped += 1
+            continue
+        batch.append(row)
+        if conversation_id not in newest or row["created_at"] > newest[conversation_id]["created_at"]:
+            newest[conversation_id] = row
+        if len(batch) >= batch_size:
+            await write(batch)
+            imported += len(batch)
+            batch = []
+            print(f"Imported {imported} messages")
+    if batch:
+        await write(batch)
+        imported += len(batch)
+    if skipped:
+        print(f"Skipped {skipped} messages that are not newer than their conversation's archive")
+
+    if mark_read:
+        async with AsyncSessionLocal() as db:
+            for conversation_id, row in newest.items():
+                if row["group_id"]:
+                    participants = await membership_cache.get_members(row["group_id"]) or {}
+                else:
+                    participants = {row["sender_id"], row["receiver_id"]}
+                for user_id in participants:
+                    await advance_watermark(db, user_id, conversation_id, row["created_at"], row["id"])
+            await db.commit()
+    return imported
+
+async def export_to_file(conversation_id: str, path: str) -> None:
+    with open(path, "wb") as output:
+        async for chunk in iter_conversation_ndjson(conversation_id):
+            output.write(chunk)
+
+if __name__ == "__main__":
+    # python -m app.chat.export export <conversation_id> <file>
+    # python -m app.chat.export import <file> [--unread]
+    import sys
+    args = sys.argv[1:]
+    if len(args) == 3 and args[0] == "export":
+        asyncio.run(export_to_file(args[1], args[2]))
+    elif len(args) in (2, 3) and args[0] == "import":
+        with open(args[1], encoding="utf-8") as source:
+            count = asyncio.run(import_messages(source, mark_read="--unread" not in args))
+        print(f"Imported {count} messages in total")
+    else:
+        sys.exit("usage: python -m app.chat.export export <conversation_id> <file> | import <file> [--unread]")
@@ -1,23 +1,67 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from sqlalchemy.orm import Session
-from app.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query
+from sqlalchemy import select, func, update, insert, delete, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from app.database import get_db, get_read_db
 from app.schemas import (
     GroupCreate, GroupResponse, GroupUpdate, 
-    GroupList, GroupMemberCreate, GroupMemberResponse
+    GroupList, GroupMemberCreate, GroupMemberResponse,
+    GroupMemberList, GroupMembersBatch, GroupMembersBatchResponse,
+    UserResponse
 )
 from app.models import User, Group, GroupMember
 from app.auth.security import get_current_active_user
+from app.chat.membership import membership_cache
+from app.chat.pagination import encode_keyset_cursor, decode_keyset_cursor
+from app.serialization import FastJSONResponse, model_fields, row_to_dict
 import uuid
 import boto3
 from app.config import settings
+from datetime import datetime
+from typing import Optional
 
 router = APIRouter()
 
+GROUP_FIELDS = [field for field in model_fields(GroupResponse) if field != "members"]
+MEMBER_FIELDS = [field for field in model_fields(GroupMemberResponse) if field != "user"]
+USER_FIELDS = model_fields(UserResponse)
+
+# GroupMemberResponse as a plain dict (the user must already be loaded)
+def member_to_dict(member: GroupMember) -> dict:
+    return {
+        **row_to_dict(member, MEMBER_FIELDS),
+        "user": row_to_dict(member.user, USER_FIELDS) if member.user else None
+    }
+
+# GroupResponse as a plain dict (members and their users only when they were loaded)
+def group_to_dict(group: Group, include_members: bool = False) -> dict:
+    members = [member_to_dict(member) for member in group.members] if include_members else None
+    return {**row_to_dict(group, GROUP_FIELDS), "members": members}
+
+# Move a group's member_count in the caller's transaction (not a change to the group's details)
+async def change_member_count(db: AsyncSession, group_id: str, delta: int):
+    await db.execute(
+        update(Group)
+        .filter(Group.id == group_id)
+        .values(member_count=Group.member_count + delta, updated_at=Group.updated_at)
+    )
+
+# Eager-load members and their users: two extra queries, however many groups and members
+MEMBERS_WITH_USERS = selectinload(Group.members).selectinload(GroupMember.user)
+
+# Load a group, with its members and their users if asked, as a GroupResponse dict
+async def get_group_response(db: AsyncSession, group_id: str, include_members: bool = False) -> dict:
+    query = select(Group).filter(Group.id == group_id)
+    if include_members:
+        query = query.options(MEMBERS_WITH_USERS)
+    result = await db.execute(query)
+    return group_to_dict(result.scalars().first(), include_members)
+
 # Create a new group
 @router.post("/groups", response_model=GroupResponse, status_code=status.HTTP_201_CREATED)
 async def create_group(
     group_data: GroupCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     # Create new group
@@ -26,147 +70,151 @@ async def create_group(
         name=group_data.name,
         description=group_data.description,
         group_picture=group_data.group_picture,
-        created_by=current_user.id
+        created_by=current_user.id,
+        member_count=1,
+        delivery_mode=group_data.delivery_mode
     )
     
-    db.add(group)
-    db.commit()
-    db.refresh(group)
-    
     # Add creator as admin member
     group_member = GroupMember(
         id=str(uuid.uuid4()),
         group_id=group.id,
         user_id=current_user.id,
-        is_admin=True
+        is_admin=True,
+        # Set here (like message timestamps) so member page cursors match it exactly
+        joined_at=datetime.utcnow()
     )
     
+    db.add(group)
     db.add(group_member)
-    db.commit()
+    await db.commit()
+    await membership_cache.invalidate(group.id)
     
-    return group
+    return await get_group_response(db, group.id)
 
 # Get all groups for current user
+#
+# One query for the page, joined on the caller's memberships. include_members=true
+# adds two batched loads for members and users, include_total=true one COUNT.
 @router.get("/groups", response_model=GroupList)
 async def get_user_groups(
     skip: int = 0,
     limit: int = 10,
-    db: Session = Depends(get_db),
+    include_members: bool = False,
+    include_total: bool = False,
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    # Get all groups where user is a member
-    user_group_members = db.query(GroupMember).filter(
-        GroupMember.user_id == current_user.id
-    ).all()
-    
-    group_ids = [member.group_id for member in user_group_members]
-    
-    # Get groups with pagination
-    groups = db.query(Group).filter(
-        Group.id.in_(group_ids)
-    ).offset(skip).limit(limit).all()
-    
-    # Count total groups
-    total = db.query(Group).filter(Group.id.in_(group_ids)).count()
-    
-    return {"groups": groups, "total": total}
+    query = (
+        select(Group)
+        .join(GroupMember, GroupMember.group_id == Group.id)
+        .filter(GroupMember.user_id == current_user.id)
+        .order_by(Group.created_at.desc(), Group.id.desc())
+        .offset(skip).limit(limit)
+    )
+    if include_members:
+        query = query.options(MEMBERS_WITH_USERS)
+    result = await db.execute(query)
+    groups = result.scalars().all()
+    
+    total = await db.scalar(
+        select(func.count()).select_from(GroupMember).filter(GroupMember.user_id == current_user.id)
+    ) if include_total else None
+    
+    return FastJSONResponse({
+        "groups": [group_to_dict(group, include_members) for group in groups],
+        "total": total
+    })
 
 # Get group by ID
 @router.get("/groups/{group_id}", response_model=GroupResponse)
 async def get_group_by_id(
     group_id: str,
-    db: Session = Depends(get_db),
+    include_members: bool = False,
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
     # Check if group exists
-    group = db.query(Group).filter(Group.id == group_id).first()
-    if not group:
+    members = await membership_cache.get_members(group_id)
+    if members is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Group not found"
         )
     
     # Check if user is a member of the group
-    is_member = db.query(GroupMember).filter(
-        GroupMember.group_id == group_id,
-        GroupMember.user_id == current_user.id
-    ).first()
-    
-    if not is_member:
+    if current_user.id not in members:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You are not a member of this group"
         )
     
-    return group
+    return await get_group_response(db, group_id, include_members)
 
 # Update group
 @router.put("/groups/{group_id}", response_model=GroupResponse)
 async def update_group(
     group_id: str,
     group_update: GroupUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     # Check if group exists
-    group = db.query(Group).filter(Group.id == group_id).first()
-    if not group:
+    members = await membership_cache.get_members(group_id)
+    if members is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Group not found"
         )
     
     # Check if user is an admin of the group
-    is_admin = db.query(GroupMember).filter(
-        GroupMember.group_id == group_id,
-        GroupMember.user_id == current_user.id,
-        GroupMember.is_admin == True
-    ).first()
-    
-    if not is_admin:
+    if not members.get(current_user.id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only group admins can update group details"
         )
     
+    result = await db.execute(select(Group).filter(Group.id == group_id))
+    group = result.scalars().first()
+    
     # Update group fields
-    for field, value in group_update.dict(exclude_unset=True).items():
+    changes = group_update.dict(exclude_unset=True)
+    for field, value in changes.items():
         setattr(group, field, value)
     
-    db.commit()
-    db.refresh(group)
+    await db.commit()
+    # The membership cache also holds the delivery mode
+    if "delivery_mode" in changes:
+        await membership_cache.invalidate(group_id)
     
-    return group
+    return await get_group_response(db, group.id)
 
 # Upload group picture
 @router.post("/groups/{group_id}/upload-picture", response_model=GroupResponse)
 async def upload_group_picture(
     group_id: str,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     # Check if group exists
-    group = db.query(Group).filter(Group.id == group_id).first()
-    if not group:
+    members = await membership_cache.get_members(group_id)
+    if members is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Group not found"
         )
     
     # Check if user is an admin of the group
-    is_admin = db.query(GroupMember).filter(
-        GroupMember.group_id == group_id,
-        GroupMember.user_id == current_user.id,
-        GroupMember.is_admin == True
-    ).first()
-    
-    if not is_admin:
+    if not members.get(current_user.id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only group admins can update group picture"
         )
     
+    result = await db.execute(select(Group).filter(Group.id == group_id))
+    group = result.scalars().first()
+    
     # Check file type
     allowed_types = ["image/jpeg", "image/png", "image/jpg"]
     if file.content_type not in allowed_types:
@@ -201,10 +249,9 @@ async def upload_group_picture(
         
         # Update group picture
         group.group_picture = file_url
-        db.commit()
-        db.refresh(group)
+        await db.commit()
         
-        return group
+        return await get_group_response(db, group.id)
     
     except Exception as e:
         raise HTTPException(
@@ -212,37 +259,90 @@ async def upload_group_picture(
             detail=f"Error uploading file: {str(e)}"
         )
 
+# List a group's members in join order, with their users
+#
+# Pass the returned next_cursor as `after` for the next page. Each page is one
+# index range on (group_id, joined_at, id) plus one batched user load.
+@router.get("/groups/{group_id}/members", response_model=GroupMemberList)
+async def get_group_members(
+    group_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    # Check if group exists
+    members = await membership_cache.get_members(group_id)
+    if members is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Group not found"
+        )
+    
+    # Check if user is a member of the group
+    if current_user.id not in members:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You are not a member of this group"
+        )
+    
+    query = (
+        select(GroupMember)
+        .filter(GroupMember.group_id == group_id)
+        .options(selectinload(GroupMember.user))
+    )
+    if after:
+        try:
+            joined_at, member_id = decode_keyset_cursor(after)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        query = query.filter(or_(
+            GroupMember.joined_at > joined_at,
+            and_(GroupMember.joined_at == joined_at, GroupMember.id > member_id)
+        ))
+    
+    # Read one extra member to know whether another page follows
+    result = await db.execute(
+        query.order_by(GroupMember.joined_at.asc(), GroupMember.id.asc()).limit(limit + 1)
+    )
+    page = list(result.scalars())
+    
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_keyset_cursor(page[-1].joined_at, page[-1].id)
+    
+    return FastJSONResponse({"members": [member_to_dict(member) for member in page], "next_cursor": next_cursor})
+
 # Add member to group
 @router.post("/groups/{group_id}/members", response_model=GroupMemberResponse)
 async def add_group_member(
     group_id: str,
     member_data: GroupMemberCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     # Check if group exists
-    group = db.query(Group).filter(Group.id == group_id).first()
-    if not group:
+    members = await membership_cache.get_members(group_id)
+    if members is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Group not found"
         )
     
     # Check if user is an admin of the group
-    is_admin = db.query(GroupMember).filter(
-        GroupMember.group_id == group_id,
-        GroupMember.user_id == current_user.id,
-        GroupMember.is_admin == True
-    ).first()
-    
-    if not is_admin:
+    if not members.get(current_user.id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only group admins can add members"
         )
     
     # Check if user to be added exists
-    user = db.query(User).filter(User.id == member_data.user_id).first()
+    result = await db.execute(select(User).filter(User.id == member_data.user_id))
+    user = result.scalars().first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -250,10 +350,11 @@ async def add_group_member(
         )
     
     # Check if user is already a member
-    existing_member = db.query(GroupMember).filter(
+    result = await db.execute(select(GroupMember).filter(
         GroupMember.group_id == group_id,
         GroupMember.user_id == member_data.user_id
-    ).first()
+    ))
+    existing_member = result.scalars().first()
     
     if existing_member:
         raise HTTPException(
@@ -266,43 +367,147 @@ async def add_group_member(
         id=str(uuid.uuid4()),
         group_id=group_id,
         user_id=member_data.user_id,
-        is_admin=member_data.is_admin
+        is_admin=member_data.is_admin,
+        joined_at=datetime.utcnow()
     )
     
     db.add(group_member)
-    db.commit()
-    db.refresh(group_member)
+    await change_member_count(db, group_id, 1)
+    await db.commit()
+    await membership_cache.invalidate(group_id)
+    group_member.user = user
     
     return group_member
 
+# Add and remove many members at once
+#
+# Validation is set-based (one query for the users, one for the current
+# members), the changes go in with one executemany insert and one delete in a
+# single transaction, and the membership cache (and with it message fan-out)
+# is invalidated once. Every requested user gets a result; users that cannot
+# be added or removed are reported and skipped rather than failing the batch.
+@router.post("/groups/{group_id}/members/batch", response_model=GroupMembersBatchResponse)
+async def batch_group_members(
+    group_id: str,
+    batch: GroupMembersBatch,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    # Check if group exists
+    members = await membership_cache.get_members(group_id)
+    if members is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Group not found"
+        )
+    
+    # Check if user is an admin of the group
+    if not members.get(current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only group admins can add or remove members"
+        )
+    
+    add_ids = {member.user_id for member in batch.add}
+    requested_ids = add_ids | set(batch.remove)
+    
+    # Current membership of every requested user, and which of the new users exist
+    result = await db.execute(
+        select(GroupMember.user_id, GroupMember.is_admin).filter(
+            GroupMember.group_id == group_id,
+            GroupMember.user_id.in_(requested_ids)
+        )
+    )
+    current = {row.user_id: row.is_admin for row in result}
+    result = await db.execute(select(User.id).filter(User.id.in_(add_ids - current.keys())))
+    existing_users = set(result.scalars())
+    
+    results = []
+    seen = set()
+    rows = []
+    joined_at = datetime.utcnow()
+    for member in batch.add:
+        if member.user_id in seen:
+            outcome = "duplicate"
+        elif member.user_id in current:
+            outcome = "already_member"
+        elif member.user_id not in existing_users:
+            outcome = "user_not_found"
+        else:
+            outcome = "added"
+            rows.append({
+                "id": str(uuid.uuid4()),
+                "group_id": group_id,
+                "user_id": member.user_id,
+                "is_admin": member.is_admin,
+                "joined_at": joined_at
+            })
+        seen.add(member.user_id)
+        results.append({"user_id": member.user_id, "action": "add", "status": outcome})
+    
+    # Admins may only be removed while another admin stays (or is being added),
+    # counted in this transaction rather than from the membership cache
+    admins_left = sum(1 for row in rows if row["is_admin"])
+    if any(current.get(user_id) for user_id in batch.remove):
+        admins_left += await db.scalar(select(func.count()).select_from(GroupMember).filter(
+            GroupMember.group_id == group_id,
+            GroupMember.is_admin == True
+        ))
+    removed = []
+    for user_id in batch.remove:
+        if user_id in seen:
+            outcome = "duplicate"
+        elif user_id not in current:
+            outcome = "not_member"
+        elif current[user_id] and admins_left <= 1:
+            outcome = "last_admin"
+        else:
+            outcome = "removed"
+            removed.append(user_id)
+            if current[user_id]:
+                admins_left -= 1
+        seen.add(user_id)
+        results.append({"user_id": user_id, "action": "remove", "status": outcome})
+    
+    if rows:
+        await db.execute(insert(GroupMember), rows)
+    if removed:
+        await db.execute(
+            delete(GroupMember).filter(GroupMember.group_id == group_id, GroupMember.user_id.in_(removed))
+        )
+    if rows or removed:
+        await change_member_count(db, group_id, len(rows) - len(removed))
+        await db.commit()
+        await membership_cache.invalidate(group_id)
+    
+    member_count = await db.scalar(select(Group.member_count).filter(Group.id == group_id))
+    return {"results": results, "member_count": member_count}
+
 # Remove member from group
 @router.delete("/groups/{group_id}/members/{member_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def remove_group_member(
     group_id: str,
     member_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     # Check if group exists
-    group = db.query(Group).filter(Group.id == group_id).first()
-    if not group:
+    members = await membership_cache.get_members(group_id)
+    if members is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Group not found"
         )
     
     # Check if current user is an admin of the group
-    is_admin = db.query(GroupMember).filter(
-        GroupMember.group_id == group_id,
-        GroupMember.user_id == current_user.id,
-        GroupMember.is_admin == True
-    ).first()
+    is_admin = members.get(current_user.id, False)
     
     # Check if member exists
-    member = db.query(GroupMember).filter(
+    result = await db.execute(select(GroupMember).filter(
         GroupMember.id == member_id,
         GroupMember.group_id == group_id
-    ).first()
+    ))
+    member = result.scalars().first()
     
     if not member:
         raise HTTPException(
@@ -319,10 +524,10 @@ async def remove_group_member(
     
     # Prevent removal of the last admin
     if member.is_admin:
-        admin_count = db.query(GroupMember).filter(
+        admin_count = await db.scalar(select(func.count()).select_from(GroupMember).filter(
             GroupMember.group_id == group_id,
             GroupMember.is_admin == True
-        ).count()
+        ))
         
         if admin_count <= 1:
             raise HTTPException(
@@ -331,7 +536,9 @@ async def remove_group_member(
             )
     
     # Remove member
-    db.delete(member)
-    db.commit()
+    await db.delete(member)
+    await change_member_count(db, group_id, -1)
+    await db.commit()
+    await membership_cache.invalidate(group_id)
     
     return None 
\ No newline at end of file
@@ -0,0 +1,438 @@
+from fastapi import WebSocket, WebSocketDisconnect
+from app.config import settings
+from app.redis_client import refresh_users_online, clear_user_online, get_async_redis_client
+from app.chat.metrics import LatencyRecorder
+from app.chat.codec import EncodedFrames, negotiate_codec, json_codec
+from app.chat.membership import membership_cache
+from typing import Dict, Iterable, Optional, Set, Union
+import asyncio
+import json
+import time
+import uuid
+
+# Event types that can be dropped when a client falls behind
+EPHEMERAL_EVENTS = {"typing", "ping"}
+
+# Close code sent to clients evicted for not keeping up (1013 = try again later)
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+# Close code sent to sessions reaped for missing heartbeats (1001 = going away)
+IDLE_CLOSE_CODE = 1001
+
+# Fan-outs with at least this many recipients are also timed separately
+LARGE_FANOUT_THRESHOLD = 100
+
+# A single WebSocket session (one tab or device) with its own outbound queue
+#
+# Frames are queued already encoded with the session's codec, without
+# awaiting the socket, and written by a dedicated task, so a slow client only
+# ever delays itself.
+class ClientConnection:
+    def __init__(self, websocket: WebSocket, user_id: str, queue_size: int, codec=json_codec):
+        self.id = uuid.uuid4().hex
+        self.websocket = websocket
+        self.user_id = user_id
+        self.codec = codec
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.writer_task: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.closed = False
+        # Set along with closed, to wake senders waiting for room in the queue
+        self.closed_event = asyncio.Event()
+        self.last_seen = time.monotonic()
+        # Groups this session subscribed to (channel-mode rooms)
+        self.rooms: Set[str] = set()
+
+    # Stop accepting frames (the writer, if still running, is stopped by close())
+    def mark_closed(self):
+        self.closed = True
+        self.closed_event.set()
+
+    # Record inbound activity (any frame, including pongs, counts)
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+    def start(self):
+        self.writer_task = asyncio.create_task(self._write())
+
+    # Receive and decode the next frame (text or binary)
+    async def receive(self) -> dict:
+        message = await self.websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        self.touch()
+        data = message.get("bytes")
+        return self.codec.decode(data if data is not None else message["text"])
+
+    # Encode a message with this session's codec and queue it, waiting for room
+    async def send_message(self, message: dict):
+        await self.send(self.codec.encode(message))
+
+    # Queue an encoded frame; returns False if the queue is full
+    def enqueue(self, frame: Union[str, bytes]) -> bool:
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    # Queue an encoded frame, waiting for room instead of applying the overflow policy
+    #
+    # Gives up without queueing the frame if the session closes while it waits
+    # (its writer is gone then, so the queue would never drain).
+    async def send(self, frame: Union[str, bytes]):
+        if self.enqueue(frame) or self.closed:
+            return
+        put = asyncio.ensure_future(self.queue.put(frame))
+        closed = asyncio.ensure_future(self.closed_event.wait())
+        try:
+            await asyncio.wait({put, closed}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            put.cancel()
+            closed.cancel()
+
+    async def _write(self):
+        try:
+            while True:
+                frame = await self.queue.get()
+                if isinstance(frame, bytes):
+                    await self.websocket.send_bytes(frame)
+                else:
+                    await self.websocket.send_text(frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The socket is gone; the receive loop will notice and disconnect us
+            print(f"WebSocket writer for {self.user_id} stopped: {e}")
+            self.mark_closed()
+
+    async def close(self, code: int = 1000):
+        self.mark_closed()
+        if self.writer_task is not None and self.writer_task is not asyncio.current_task():
+            self.writer_task.cancel()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+# WebSocket connection manager
+#
+# Connections are always tracked in-process, as a set of sessions per user.
+# With WEBSOCKET_BROKER=redis each worker also subscribes to a Redis channel
+# for every user connected to it, and messages are published to that channel
+# so sessions the user has open on other workers receive them too.
+#
+# Sessions can also subscribe to rooms (channel-mode groups). A room message
+# goes to the sessions subscribed to it, and in Redis mode is published once
+# on the room's channel, which only workers with subscribers listen to, so
+# its cost follows the number of viewers rather than the number of members.
+class ConnectionManager:
+    def __init__(
+        self,
+        broker: str = "memory",
+        queue_size: int = 256,
+        overflow_policy: str = "drop_ephemeral",
+        fanout_concurrency: int = 64,
+        heartbeat_interval: float = 25,
+        idle_timeout: float = 75
+    ):
+        self.active_connections: Dict[str, Set[ClientConnection]] = {}
+        self.rooms: Dict[str, Set[ClientConnection]] = {}
+        self.broker = broker
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.fanout_concurrency = fanout_concurrency
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.heartbeat_task: Optional[asyncio.Task] = None
+        self.reaped = 0
+        self.fanout_latency = LatencyRecorder()
+        self.large_fanout_latency = LatencyRecorder()
+        self.node_id = uuid.uuid4().hex
+        self.pubsub = None
+        self.listener_task: Optional[asyncio.Task] = None
+        # Slow-consumer closes in progress (the loop only keeps weak references to tasks)
+        self.close_tasks: Set[asyncio.Task] = set()
+
+    @property
+    def distributed(self) -> bool:
+        return self.broker == "redis"
+
+    def user_channel(self, user_id: str) -> str:
+        return f"{settings.WEBSOCKET_CHANNEL_PREFIX}:user:{user_id}"
+
+    def broadcast_channel(self) -> str:
+        return f"{settings.WEBSOCKET_CHANNEL_PREFIX}:broadcast"
+
+    def room_channel(self, group_id: str) -> str:
+        return f"{settings.WEBSOCKET_CHANNEL_PREFIX}:room:{group_id}"
+
+    # Start the heartbeat task and, in Redis mode, the pub/sub listener
+    async def start(self):
+        if self.heartbeat_task is None:
+            self.heartbeat_task = asyncio.create_task(self._heartbeat())
+        if not self.distributed or self.listener_task is not None:
+            return
+        self.pubsub = get_async_redis_client().pubsub(ignore_subscribe_messages=True)
+        await self.pubsub.subscribe(self.broadcast_channel())
+        self.listener_task = asyncio.create_task(self._listen())
+
+    # Stop the heartbeat task and the pub/sub listener
+    async def stop(self):
+        for task in (self.heartbeat_task, self.listener_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self.heartbeat_task = None
+        self.listener_task = None
+        if self.pubsub is not None:
+            await self.pubsub.aclose()
+            self.pubsub = None
+
+    async def connect(self, websocket: WebSocket, user_id: str) -> ClientConnection:
+        # Pick the wire codec from the subprotocols the client offered
+        codec, subprotocol = negotiate_codec(websocket)
+        await websocket.accept(subprotocol=subprotocol)
+        connection = ClientConnection(websocket, user_id, self.queue_size, codec)
+        connection.start()
+        first_session = user_id not in self.active_connections
+        self.active_connections.setdefault(user_id, set()).add(connection)
+        if first_session:
+            await refresh_users_online([user_id], self.node_id)
+            if self.pubsub is not None:
+                await self.pubsub.subscribe(self.user_channel(user_id))
+        return connection
+
+    async def disconnect(self, connection: ClientConnection):
+        if connection.writer_task is not None:
+            connection.writer_task.cancel()
+        connection.mark_closed()
+        for group_id in list(connection.rooms):
+            await self.unsubscribe_room(connection, group_id)
+        connections = self.active_connections.get(connection.user_id)
+        if connections is None or connection not in connections:
+            return
+        connections.discard(connection)
+        if not connections:
+            del self.active_connections[connection.user_id]
+            await clear_user_online(connection.user_id, self.node_id)
+            if self.pubsub is not None:
+                await self.pubsub.unsubscribe(self.user_channel(connection.user_id))
+
+    # Subscribe a session to a group's room (the caller checks membership)
+    async def subscribe_room(self, connection: ClientConnection, group_id: str):
+        if group_id in connection.rooms:
+            return
+        connection.rooms.add(group_id)
+        first_session = group_id not in self.rooms
+        self.rooms.setdefault(group_id, set()).add(connection)
+        if first_session and self.pubsub is not None:
+            await self.pubsub.subscribe(self.room_channel(group_id))
+
+    async def unsubscribe_room(self, connection: ClientConnection, group_id: str):
+        connection.rooms.discard(group_id)
+        connections = self.rooms.get(group_id)
+        if connections is None or connection not in connections:
+            return
+        connections.discard(connection)
+        if not connections:
+            del self.rooms[group_id]
+            if self.pubsub is not None:
+                await self.pubsub.unsubscribe(self.room_channel(group_id))
+
+    # Queue a message on the local sessions in a room, skipping one user's sessions
+    #
+    # Subscriptions are checked against the group's current members, so users
+    # removed from the group stop receiving its messages at once.
+    async def _deliver_room(self, frames: EncodedFrames, group_id: str, ephemeral: bool, exclude_user_id: Optional[str]):
+        connections = self.rooms.get(group_id)
+        if not connections:
+            return
+        member_ids = await membership_cache.get_members(group_id) or {}
+        for connection in list(connections):
+            if connection.user_id == exclude_user_id or connection.user_id not in member_ids:
+                continue
+            if not connection.enqueue(frames.get(connection.codec)):
+                self._handle_overflow(connection, ephemeral)
+
+    # Deliver one message to every session subscribed to a group's room
+    #
+    # exclude_user_id (usually the sender) skips that user's sessions.
+    async def send_to_room(self, message: dict, group_id: str, exclude_user_id: Optional[str] = None):
+        started = time.perf_counter()
+        frames = EncodedFrames(message)
+        ephemeral = message.get("type") in EPHEMERAL_EVENTS
+        await self._deliver_room(frames, group_id, ephemeral, exclude_user_id)
+        if self.pubsub is not None:
+            envelope = json.dumps({
+                "origin": self.node_id,
+                "frame": frames.get(json_codec),
+                "ephemeral": ephemeral,
+                "exclude": exclude_user_id
+            })
+            await self._publish(self.room_channel(group_id), envelope)
+        self.fanout_latency.record((time.perf_counter() - started) * 1000)
+
+    # Queue a message on every local session of a user; returns True if any accepted it
+    def _deliver_local(self, frames: EncodedFrames, user_id: str, ephemeral: bool) -> bool:
+        delivered = False
+        for connection in list(self.active_connections.get(user_id, ())):
+            if connection.enqueue(frames.get(connection.codec)):
+                delivered = True
+            else:
+                self._handle_overflow(connection, ephemeral)
+        return delivered
+
+    def _handle_overflow(self, connection: ClientConnection, ephemeral: bool):
+        connection.dropped += 1
+        if self.overflow_policy == "drop":
+            return
+        if self.overflow_policy == "drop_ephemeral" and ephemeral:
+            return
+        if connection.closed:
+            return
+        print(f"Disconnecting slow WebSocket client {connection.user_id} ({connection.queue.qsize()} frames queued)")
+        connection.mark_closed()
+        task = asyncio.create_task(connection.close(code=SLOW_CONSUMER_CLOSE_CODE))
+        self.close_tasks.add(task)
+        task.add_done_callback(self.close_tasks.discard)
+
+    # Deliver a message to every session of a user; returns True if any session got it
+    async def send_personal_message(self, message: dict, user_id: str) -> bool:
+        return user_id in await self.send_to_users(message, [user_id])
+
+    # Deliver one message to many users; returns the ids of users that received it
+    #
+    # The frame is encoded once per codec in use. Local sessions are queued synchronously and,
+    # in Redis mode, the per-user publishes run concurrently up to
+    # fanout_concurrency at a time.
+    async def send_to_users(self, message: dict, user_ids: Iterable[str]) -> Set[str]:
+        started = time.perf_counter()
+        frames = EncodedFrames(message)
+        ephemeral = message.get("type") in EPHEMERAL_EVENTS
+        user_ids = list(dict.fromkeys(user_ids))
+        delivered = {
+            user_id for user_id in user_ids
+            if self._deliver_local(frames, user_id, ephemeral)
+        }
+
+        if self.pubsub is not None and user_ids:
+            # Workers exchange JSON; each one re-encodes for its own sessions' codecs
+            envelope = json.dumps({"origin": self.node_id, "frame": frames.get(json_codec), "ephemeral": ephemeral})
+            semaphore = asyncio.Semaphore(self.fanout_concurrency)
+
+            async def publish(user_id: str):
+                async with semaphore:
+                    receivers = await self._publish(self.user_channel(user_id), envelope)
+                # Our own subscription counts as a receiver when the user is connected here
+                if receivers > (1 if user_id in self.active_connections else 0):
+                    delivered.add(user_id)
+
+            await asyncio.gather(*(publish(user_id) for user_id in user_ids))
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.fanout_latency.record(elapsed_ms)
+        if len(user_ids) >= LARGE_FANOUT_THRESHOLD:
+            self.large_fanout_latency.record(elapsed_ms)
+        return delivered
+
+    async def broadcast(self, message: dict):
+        frames = EncodedFrames(message)
+        ephemeral = message.get("type") in EPHEMERAL_EVENTS
+        for user_id in list(self.active_connections):
+            self._deliver_local(frames, user_id, ephemeral)
+        if self.pubsub is not None:
+            envelope = json.dumps({"origin": self.node_id, "frame": frames.get(json_codec), "ephemeral": ephemeral})
+            await self._publish(self.broadcast_channel(), envelope)
+
+    # Ping every session, reap the ones that stopped answering and refresh presence
+    #
+    # Runs every heartbeat_interval seconds. Clients reply to "ping" with
+    # "pong"; any inbound frame resets the idle timer.
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                now = time.monotonic()
+                ping = EncodedFrames({"type": "ping", "data": {}})
+                for connections in list(self.active_connections.values()):
+                    for connection in list(connections):
+                        if now - connection.last_seen > self.idle_timeout:
+                            await self._reap(connection)
+                        elif not connection.enqueue(ping.get(connection.codec)):
+                            self._handle_overflow(connection, ephemeral=True)
+                await refresh_users_online(list(self.active_connections), self.node_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"WebSocket heartbeat error: {e}")
+
+    async def _reap(self, connection: ClientConnection):
+        print(f"Closing idle WebSocket session for {connection.user_id}")
+        self.reaped += 1
+        await self.disconnect(connection)
+        await connection.close(code=IDLE_CLOSE_CODE)
+
+    # Delivery statistics for monitoring
+    def stats(self) -> dict:
+        return {
+            "local_users": len(self.active_connections),
+            "local_sessions": sum(len(connections) for connections in self.active_connections.values()),
+            "reaped_sessions": self.reaped,
+            "local_rooms": len(self.rooms),
+            "room_sessions": sum(len(connections) for connections in self.rooms.values()),
+            "queued_frames": sum(
+                connection.queue.qsize()
+                for connections in self.active_connections.values()
+                for connection in connections
+            ),
+            "fanout_ms": self.fanout_latency.summary(),
+            "large_fanout_ms": self.large_fanout_latency.summary()
+        }
+
+    async def _publish(self, channel: str, envelope: str) -> int:
+        try:
+            return await get_async_redis_client().publish(channel, envelope)
+        except Exception as e:
+            print(f"Error publishing WebSocket message: {e}")
+            return 0
+
+    # Relay messages published by other workers to local sessions
+    async def _listen(self):
+        while True:
+            try:
+                item = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if item is None:
+                    continue
+                envelope = json.loads(item["data"])
+                if envelope["origin"] == self.node_id:
+                    continue
+                channel = item["channel"]
+                frames = EncodedFrames(json_frame=envelope["frame"])
+                ephemeral = envelope["ephemeral"]
+                if channel == self.broadcast_channel():
+                    for user_id in list(self.active_connections):
+                        self._deliver_local(frames, user_id, ephemeral)
+                elif channel.startswith(self.room_channel("")):
+                    await self._deliver_room(frames, channel.rsplit(":", 1)[-1], ephemeral, envelope.get("exclude"))
+                else:
+                    self._deliver_local(frames, channel.rsplit(":", 1)[-1], ephemeral)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"WebSocket pub/sub listener error: {e}")
+                await asyncio.sleep(1)
+
+manager = ConnectionManager(
+    broker=settings.WEBSOCKET_BROKER,
+    queue_size=settings.WEBSOCKET_SEND_QUEUE_SIZE,
+    overflow_policy=settings.WEBSOCKET_OVERFLOW_POLICY,
+    fanout_concurrency=settings.WEBSOCKET_FANOUT_CONCURRENCY,
+    heartbeat_interval=settings.WEBSOCKET_HEARTBEAT_SECONDS,
+    idle_timeout=settings.WEBSOCKET_IDLE_TIMEOUT_SECONDS
+)
@@ -0,0 +1,174 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.redis_client import get_async_redis_client
+from app.models import User, Group, GroupMember, GroupDeliveryMode
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import asyncio
+import json
+import time
+import uuid
+
+# A cached group: ({user_id: is_admin}, delivery mode)
+GroupEntry = Tuple[Dict[str, bool], GroupDeliveryMode]
+
+# Group membership and role cache
+#
+# Maps a group id to {user_id: is_admin} for its members and the group's
+# delivery mode, or None if the group does not exist. Entries live in an in-process LRU for ttl seconds. Routes
+# that change membership call invalidate(), which drops the local entry and,
+# with the "redis" broker, publishes the group id so every other worker drops
+# it too. Callers must treat returned dicts as read-only.
+class MembershipCache:
+    def __init__(self, broker: str = "memory", max_size: int = 10000, ttl: float = 60.0):
+        self.distributed = broker == "redis"
+        self.max_size = max_size
+        self.ttl = ttl
+        self.node_id = uuid.uuid4().hex
+        self.entries: "OrderedDict[str, Tuple[float, Optional[GroupEntry]]]" = OrderedDict()
+        # Bumped on every invalidation so a load that raced with one is not cached
+        self.version = 0
+        self.pubsub = None
+        self.listener_task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def channel(self) -> str:
+        return f"{settings.WEBSOCKET_CHANNEL_PREFIX}:membership"
+
+    # Start listening for invalidations from other workers
+    async def start(self):
+        if not self.distributed or self.listener_task is not None:
+            return
+        self.pubsub = get_async_redis_client().pubsub(ignore_subscribe_messages=True)
+        await self.pubsub.subscribe(self.channel())
+        self.listener_task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self.listener_task is not None:
+            self.listener_task.cancel()
+            try:
+                await self.listener_task
+            except asyncio.CancelledError:
+                pass
+            self.listener_task = None
+        if self.pubsub is not None:
+            await self.pubsub.aclose()
+            self.pubsub = None
+
+    # Members of a group as {user_id: is_admin}, or None if the group does not exist
+    async def get_members(self, group_id: str) -> Optional[Dict[str, bool]]:
+        entry = await self.get_group(group_id)
+        return entry[0] if entry is not None else None
+
+    # Members and delivery mode of a group, or None if the group does not exist
+    #
+    # Misses are always loaded from the primary in a session of their own,
+    # never through a caller's (possibly replica) session: a lagging replica
+    # would put the membership from before an invalidate() back in the cache
+    # for a whole ttl.
+    async def get_group(self, group_id: str) -> Optional[GroupEntry]:
+        entry = self.entries.get(group_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self.entries.move_to_end(group_id)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        version = self.version
+        async with AsyncSessionLocal() as session:
+            group = await self._load(session, group_id)
+
+        if version == self.version:
+            self.entries[group_id] = (time.monotonic() + self.ttl, group)
+            self.entries.move_to_end(group_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return group
+
+    # Drop a group's entry here and on every other worker (call after committing)
+    async def invalidate(self, group_id: str):
+        self._drop(group_id)
+        if self.pubsub is None:
+            return
+        try:
+            await get_async_redis_client().publish(
+                self.channel(), json.dumps({"origin": self.node_id, "group_id": group_id})
+            )
+        except Exception as e:
+            print(f"Error publishing membership invalidation: {e}")
+
+    def _drop(self, group_id: str):
+        self.version += 1
+        self.invalidations += 1
+        self.entries.pop(group_id, None)
+
+    # Load the group and its members with a single outer join
+    async def _load(self, db: AsyncSession, group_id: str) -> Optional[GroupEntry]:
+        result = await db.execute(
+            select(Group.id, Group.delivery_mode, GroupMember.user_id, GroupMember.is_admin)
+            .outerjoin(GroupMember, GroupMember.group_id == Group.id)
+            .filter(Group.id == group_id)
+        )
+        rows = result.all()
+        if not rows:
+            return None
+        members = {row.user_id: bool(row.is_admin) for row in rows if row.user_id is not None}
+        return members, rows[0].delivery_mode or GroupDeliveryMode.MEMBERS
+
+    async def _listen(self):
+        while True:
+            try:
+                item = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if item is None:
+                    continue
+                message = json.loads(item["data"])
+                if message["origin"] != self.node_id:
+                    self._drop(message["group_id"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Invalidations may have been missed; start over from the database
+                print(f"Membership cache listener error: {e}")
+                self.version += 1
+                self.entries.clear()
+                await asyncio.sleep(1)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations
+        }
+
+# Ids of users known to exist, for checking message receivers without a
+# query per message. Users are never deleted, so only hits are cached and
+# they never go stale.
+class UserDirectory:
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self.known: "OrderedDict[str, None]" = OrderedDict()
+
+    async def exists(self, user_id: str) -> bool:
+        if user_id in self.known:
+            self.known.move_to_end(user_id)
+            return True
+        async with AsyncSessionLocal() as db:
+            found = await db.scalar(select(User.id).filter(User.id == user_id)) is not None
+        if found:
+            self.known[user_id] = None
+            while len(self.known) > self.max_size:
+                self.known.popitem(last=False)
+        return found
+
+membership_cache = MembershipCache(
+    broker=settings.WEBSOCKET_BROKER,
+    max_size=settings.MEMBERSHIP_CACHE_SIZE,
+    ttl=settings.MEMBERSHIP_CACHE_TTL_SECONDS
+)
+
+user_directory = UserDirectory(max_size=settings.MEMBERSHIP_CACHE_SIZE)
@@ -0,0 +1,29 @@
+from collections import deque
+from typing import Dict
+
+# Rolling window of latency samples (in milliseconds) with percentile summaries
+class LatencyRecorder:
+    def __init__(self, window: int = 2048):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, duration_ms: float):
+        self.samples.append(duration_ms)
+        self.count += 1
+
+    def summary(self) -> Dict[str, float]:
+        samples = sorted(self.samples)
+        if not samples:
+            return {"count": self.count, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+
+        def percentile(p: float) -> float:
+            index = min(len(samples) - 1, int(round(p * (len(samples) - 1))))
+            return round(samples[index], 3)
+
+        return {
+            "count": self.count,
+            "p50": percentile(0.50),
+            "p95": percentile(0.95),
+            "p99": percentile(0.99),
+            "max": round(samples[-1], 3)
+        }
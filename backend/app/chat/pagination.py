@@ -0,0 +1,122 @@
+from fastapi import HTTPException, status
+from sqlalchemy import select, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import Message
+from app.schemas import MessageResponse
+from app.serialization import model_fields
+from app.chat.pending import message_cursor, cursor_to_datetime
+from app.chat.archive import read_archived_messages
+from datetime import datetime
+from typing import List, Optional, Tuple
+import base64
+
+# Keyset pagination for message history
+#
+# A page cursor is an opaque token for a message's (created_at, id) position.
+# Pages are read with an index range instead of an OFFSET, so every page costs
+# the same and rows inserted meanwhile never shift a page that is being read.
+
+# Opaque cursor for a (timestamp, key) position
+def encode_keyset_cursor(timestamp: datetime, key: str) -> str:
+    raw = f"{message_cursor(timestamp)}:{key}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+# Inverse of encode_keyset_cursor; raises ValueError for malformed cursors
+def decode_keyset_cursor(cursor: str) -> Tuple[datetime, str]:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    timestamp, key = base64.urlsafe_b64decode(padded.encode()).decode().split(":", 1)
+    return cursor_to_datetime(int(timestamp)), key
+
+def encode_page_cursor(message) -> str:
+    return encode_keyset_cursor(message.created_at, message.id)
+
+def decode_page_cursor(cursor: str) -> Tuple[datetime, str]:
+    return decode_keyset_cursor(cursor)
+
+# Columns read for a history page: exactly what MessageResponse shows, no ORM objects
+PAGE_COLUMNS = [getattr(Message, field) for field in model_fields(MessageResponse)]
+
+# Hot-table query for the messages after (ascending) or before (descending) a position
+def hot_page_query(conversation_filter, before=None, after=None):
+    query = select(*PAGE_COLUMNS).filter(conversation_filter)
+    if after is not None:
+        created_at, message_id = after
+        return query.filter(or_(
+            Message.created_at > created_at,
+            and_(Message.created_at == created_at, Message.id > message_id)
+        )).order_by(Message.created_at.asc(), Message.id.asc())
+    if before is not None:
+        created_at, message_id = before
+        query = query.filter(or_(
+            Message.created_at < created_at,
+            and_(Message.created_at == created_at, Message.id < message_id)
+        ))
+    return query.order_by(Message.created_at.desc(), Message.id.desc())
+
+# Fetch one page of messages matching a conversation filter, newest first
+#
+# Messages are rows of PAGE_COLUMNS (archived ones are detached Message
+# objects with the same attributes).
+#
+# With `before`, returns the messages older than that cursor; with `after`,
+# the oldest messages newer than it; with neither, the latest messages
+# (skipping `skip` rows, kept for old clients). The returned next cursor
+# continues in the same direction and is None when there is nothing more.
+#
+# Pages that reach past the oldest message in the messages table continue
+# into the cold archive of the conversation (conversation_id), which only
+# holds messages older than every hot one.
+async def fetch_message_page(
+    db: AsyncSession,
+    conversation_filter,
+    limit: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    skip: int = 0,
+    conversation_id: Optional[str] = None
+) -> Tuple[List[Message], Optional[str]]:
+    if before and after:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Pass either before or after, not both"
+        )
+    try:
+        before_position = decode_page_cursor(before) if before else None
+        after_position = decode_page_cursor(after) if after else None
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+    # Read one extra message to know whether another page follows
+    wanted = limit + 1
+    if after_position is not None:
+        # Oldest first: archived messages come before hot ones
+        messages = []
+        if conversation_id is not None:
+            messages = await read_archived_messages(db, conversation_id, wanted, after=after_position)
+        if len(messages) < wanted:
+            position = (messages[-1].created_at, messages[-1].id) if messages else after_position
+            result = await db.execute(hot_page_query(conversation_filter, after=position).limit(wanted - len(messages)))
+            messages.extend(result.all())
+    else:
+        query = hot_page_query(conversation_filter, before=before_position)
+        if skip and before_position is None:
+            query = query.offset(skip)
+        result = await db.execute(query.limit(wanted))
+        messages = list(result.all())
+        # Offset pages (old clients) stay within the hot table
+        if len(messages) < wanted and conversation_id is not None and not (skip and before_position is None):
+            position = (messages[-1].created_at, messages[-1].id) if messages else before_position
+            messages.extend(await read_archived_messages(
+                db, conversation_id, wanted - len(messages), before=position
+            ))
+
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    next_cursor = encode_page_cursor(messages[-1]) if has_more else None
+
+    if after_position is not None:
+        messages.reverse()
+    return messages, next_cursor
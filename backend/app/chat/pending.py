@@ -0,0 +1,95 @@
+from app.config import settings
+from app.redis_client import get_async_redis_client
+from datetime import datetime
+from typing import Iterable, List, Optional, Set, Tuple
+import calendar
+import json
+
+# Per-user pending index used to resync clients after a reconnect
+#
+# Every chat message is stored once under pending:msg:{id}, and its id is
+# added to a sorted set pending:{user_id} for each participant, scored by
+# its cursor. A reconnecting client sends the cursor of the last message it
+# saw and the server streams everything after it from these sets, without
+# running a history query per conversation. Each set keeps the most recent
+# PENDING_INDEX_SIZE entries and everything expires after PENDING_TTL_SECONDS.
+
+def pending_key(user_id: str) -> str:
+    return f"pending:{user_id}"
+
+def pending_message_key(message_id: str) -> str:
+    return f"pending:msg:{message_id}"
+
+# Cursor for a message: its UTC creation time in microseconds
+def message_cursor(created_at: datetime) -> int:
+    return calendar.timegm(created_at.utctimetuple()) * 1_000_000 + created_at.microsecond
+
+# Inverse of message_cursor, as a naive UTC datetime
+def cursor_to_datetime(cursor: int) -> datetime:
+    return datetime.utcfromtimestamp(cursor // 1_000_000).replace(microsecond=cursor % 1_000_000)
+
+# Add a message (the "data" part of a message frame) to the index of each participant
+async def index_pending_message(message: dict, user_ids: Iterable[str]):
+    try:
+        client = get_async_redis_client()
+        pipe = client.pipeline(transaction=False)
+        pipe.set(pending_message_key(message["id"]), json.dumps(message), ex=settings.PENDING_TTL_SECONDS)
+        for user_id in set(user_ids):
+            key = pending_key(user_id)
+            pipe.zadd(key, {message["id"]: message["cursor"]})
+            pipe.zremrangebyrank(key, 0, -(settings.PENDING_INDEX_SIZE + 1))
+            pipe.expire(key, settings.PENDING_TTL_SECONDS)
+        await pipe.execute()
+    except Exception as e:
+        print(f"Error indexing pending message: {e}")
+
+# Read the next batch of messages after a cursor, oldest first
+#
+# Entries scored exactly at the cursor are included too unless listed in
+# skip, so a batch can continue from the last one even when several
+# messages share its score. Returns the messages, the score of the last
+# index entry read (which can be past the last message if some payloads have
+# already expired) and the ids of the entries read with that score.
+async def get_pending_messages(
+    user_id: str, after: int, limit: int, skip: Optional[Set[str]] = None
+) -> Tuple[List[dict], int, Set[str]]:
+    client = get_async_redis_client()
+    minimum = after if skip is not None else f"({after}"
+    skip = skip or set()
+    entries = await client.zrangebyscore(
+        pending_key(user_id), minimum, "+inf", start=0, num=limit + len(skip), withscores=True
+    )
+    entries = [(message_id, score) for message_id, score in entries if message_id not in skip][:limit]
+    if not entries:
+        return [], after, skip
+    payloads = await client.mget([pending_message_key(message_id) for message_id, _ in entries])
+    messages = [json.loads(payload) for payload in payloads if payload is not None]
+    cursor = int(entries[-1][1])
+    read_at_cursor = {message_id for message_id, score in entries if int(score) == cursor}
+    if cursor == after:
+        read_at_cursor |= skip
+    return messages, cursor, read_at_cursor
+
+# Whether entries after the cursor may already have been trimmed from the index
+async def is_pending_index_truncated(user_id: str, after: int) -> bool:
+    client = get_async_redis_client()
+    key = pending_key(user_id)
+    size = await client.zcard(key)
+    if size < settings.PENDING_INDEX_SIZE:
+        return False
+    oldest = await client.zrange(key, 0, 0, withscores=True)
+    return bool(oldest) and oldest[0][1] > after
+
+# Stream every indexed message after the cursor in batches
+#
+# Yields (messages, cursor) pairs, where cursor is the score of the last
+# entry read.
+async def iter_pending_batches(user_id: str, after: int, batch_size: int):
+    cursor, skip = after, None
+    while True:
+        messages, cursor, read = await get_pending_messages(user_id, cursor, batch_size, skip)
+        if not read or read == skip:
+            return
+        skip = read
+        if messages:
+            yield messages, cursor
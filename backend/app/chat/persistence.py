@@ -0,0 +1,177 @@
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError, DataError, IntegrityError, OperationalError
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import Message
+from app.chat.metrics import LatencyRecorder
+from app.chat.conversations import record_messages
+from typing import List, Optional
+import asyncio
+import time
+
+# Number of attempts made to write a batch that fails for an unknown reason
+MAX_FLUSH_ATTEMPTS = 3
+
+# Backoff between attempts: doubles from the base delay up to the cap
+RETRY_BASE_DELAY = 0.1
+RETRY_MAX_DELAY = 5.0
+
+# Errors caused by the rows themselves; retrying the same rows cannot help
+ROW_ERRORS = (IntegrityError, DataError)
+
+# Errors from the database being unreachable or busy, which clear on their own
+def is_transient_error(error: Exception) -> bool:
+    if isinstance(error, OperationalError):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+def retry_delay(attempt: int) -> float:
+    return min(RETRY_BASE_DELAY * 2 ** (attempt - 1), RETRY_MAX_DELAY)
+
+# Write-behind message writer
+#
+# Messages arrive already carrying their server-assigned id and timestamp, so
+# they can be acknowledged and fanned out straight away. Rows are queued here
+# and a background task inserts them in batches: a batch is written as soon
+# as it reaches batch_size rows or flush_interval seconds after its first
+# row, whichever comes first. Stopping the writer flushes everything queued.
+#
+# The rows have already been acknowledged, so a batch is only ever given up
+# on row by row. While the database is unreachable the batch is retried with
+# backoff for as long as it takes; the queue fills up meanwhile and enqueue()
+# slows senders down. A batch rejected for its data (or failing for an
+# unknown reason MAX_FLUSH_ATTEMPTS times) is split until the rows at fault
+# are isolated, so one bad row never takes the rest of its batch down with it.
+class MessageWriter:
+    def __init__(self, batch_size: int = 500, flush_interval: float = 0.05, queue_size: int = 10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.task: Optional[asyncio.Task] = None
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.flush_latency = LatencyRecorder()
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None
+
+    async def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    # Flush everything still queued and stop the background task
+    async def stop(self):
+        if self.task is None:
+            return
+        await self.queue.put(None)
+        await self.task
+        self.task = None
+
+    # Queue a row for insertion (waits only when the queue is full)
+    async def enqueue(self, row: dict):
+        await self.queue.put(row)
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            row = await self.queue.get()
+            if row is None:
+                await self._drain()
+                return
+
+            batch = [row]
+            stopping = False
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+
+            await self._flush(batch)
+            if stopping:
+                await self._drain()
+                return
+
+    # Write whatever is left in the queue without waiting for more
+    async def _drain(self):
+        batch = []
+        while not self.queue.empty():
+            row = self.queue.get_nowait()
+            if row is None:
+                continue
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                await self._flush(batch)
+                batch = []
+        if batch:
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[dict]):
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                await self._write_batch(batch)
+                self.written += len(batch)
+                self.batches += 1
+                self.flush_latency.record((time.perf_counter() - started) * 1000)
+                return
+            except Exception as e:
+                print(f"Error writing {len(batch)} messages (attempt {attempt}): {e}")
+                if isinstance(e, ROW_ERRORS):
+                    break
+                if not is_transient_error(e) and attempt >= MAX_FLUSH_ATTEMPTS:
+                    break
+                await asyncio.sleep(retry_delay(attempt))
+        await self._write_halves(batch)
+
+    # Retry a rejected batch in halves, down to single rows, so only the rows
+    # that fail on their own are dropped (and their ids logged)
+    async def _write_halves(self, batch: List[dict]):
+        if len(batch) == 1:
+            self.failed += 1
+            print(f"Dropping message {batch[0]['id']}")
+            return
+        middle = len(batch) // 2
+        for half in (batch[:middle], batch[middle:]):
+            await self._flush(half)
+
+    # Insert one batch and update the inbox read-model in a single transaction
+    async def _write_batch(self, batch: List[dict]):
+        async with AsyncSessionLocal() as db:
+            await db.execute(insert(Message), batch)
+            await record_messages(db, batch)
+            await db.commit()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.running,
+            "queue_depth": self.queue.qsize(),
+            "max_queue_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+            "flush_ms": self.flush_latency.summary()
+        }
+
+message_writer = MessageWriter(
+    batch_size=settings.MESSAGE_WRITE_BATCH_SIZE,
+    flush_interval=settings.MESSAGE_WRITE_FLUSH_MS / 1000,
+    queue_size=settings.MESSAGE_WRITE_QUEUE_SIZE
+)
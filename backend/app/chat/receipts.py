@@ -0,0 +1,71 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import ReadWatermark, MessageStatus
+from app.chat.conversations import refresh_unread_count
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+# Move a user's read watermark forward (never backwards)
+#
+# Returns True if the watermark changed, in which case the user's unread count
+# for the conversation is recounted too. The caller commits.
+async def advance_watermark(
+    db: AsyncSession,
+    user_id: str,
+    conversation_id: str,
+    read_up_to: datetime,
+    message_id: Optional[str] = None
+) -> bool:
+    watermark = await db.get(ReadWatermark, (user_id, conversation_id))
+    if watermark is None:
+        db.add(ReadWatermark(
+            user_id=user_id,
+            conversation_id=conversation_id,
+            read_up_to=read_up_to,
+            last_read_message_id=message_id
+        ))
+    elif watermark.read_up_to >= read_up_to:
+        return False
+    else:
+        watermark.read_up_to = read_up_to
+        watermark.last_read_message_id = message_id
+    await refresh_unread_count(db, user_id, conversation_id, read_up_to)
+    return True
+
+# Get the watermarks of several users in one conversation
+async def get_watermarks(db: AsyncSession, conversation_id: str, user_ids: Iterable[str]) -> Dict[str, datetime]:
+    result = await db.execute(
+        select(ReadWatermark.user_id, ReadWatermark.read_up_to).filter(
+            ReadWatermark.conversation_id == conversation_id,
+            ReadWatermark.user_id.in_(list(user_ids))
+        )
+    )
+    return {user_id: read_up_to for user_id, read_up_to in result}
+
+# Watermarks of the receivers of direct messages from many conversations,
+# keyed by conversation id (each as get_watermarks would return it)
+async def get_receiver_watermarks(db: AsyncSession, messages: Iterable) -> Dict[str, Dict[str, datetime]]:
+    pairs = {
+        (message.conversation_id, message.receiver_id)
+        for message in messages if message.receiver_id is not None and message.conversation_id is not None
+    }
+    if not pairs:
+        return {}
+    result = await db.execute(
+        select(ReadWatermark.conversation_id, ReadWatermark.user_id, ReadWatermark.read_up_to).filter(
+            ReadWatermark.conversation_id.in_({conversation_id for conversation_id, _ in pairs}),
+            ReadWatermark.user_id.in_({user_id for _, user_id in pairs})
+        )
+    )
+    watermarks: Dict[str, Dict[str, datetime]] = {}
+    for conversation_id, user_id, read_up_to in result:
+        if (conversation_id, user_id) in pairs:
+            watermarks.setdefault(conversation_id, {})[user_id] = read_up_to
+    return watermarks
+
+# Status of a direct message as seen through the receiver's watermark
+def derive_status(message, watermarks: Dict[str, datetime]) -> MessageStatus:
+    read_up_to = watermarks.get(message.receiver_id)
+    if read_up_to is not None and message.created_at is not None and message.created_at <= read_up_to:
+        return MessageStatus.READ
+    return message.status
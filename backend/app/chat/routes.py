@@ -1,16 +1,33 @@
 from fastapi import APIRouter, Depends, HTTPException, status, WebSocket, WebSocketDisconnect, UploadFile, File, Query
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from app.database import get_db
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import select, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db, get_read_db, AsyncSessionLocal
 from app.schemas import (
     MessageCreate, MessageResponse, MessageUpdate, 
-    MessageList, WebSocketMessage, FileUploadResponse
+    MessageList, WebSocketMessage, FileUploadResponse,
+    ConversationList, SearchResponse
+)
+from app.models import (
+    User, Message, MessageStatus, MessageType, Conversation, GroupDeliveryMode,
+    direct_conversation_id, group_conversation_id, new_message_id
 )
-from app.models import User, Message, MessageStatus, MessageType, Group
 from app.auth.security import get_current_active_user, get_current_user
-from app.redis_client import set_user_online, set_user_offline, is_user_online
-from typing import List, Optional, Dict
-import json
+from app.chat.manager import manager
+from app.chat.persistence import message_writer
+from app.chat.typing_indicators import typing_tracker
+from app.chat.membership import membership_cache, user_directory
+from app.chat.pending import (
+    index_pending_message, iter_pending_batches,
+    is_pending_index_truncated, message_cursor, cursor_to_datetime
+)
+from app.chat.receipts import advance_watermark, get_watermarks, get_receiver_watermarks, derive_status
+from app.chat.pagination import fetch_message_page, encode_keyset_cursor, decode_keyset_cursor
+from app.chat.conversations import record_messages
+from app.chat.search import search_messages
+from app.serialization import FastJSONResponse, model_fields, row_to_dict
+from app.chat.export import iter_conversation_ndjson, can_export
+from typing import List, Optional
 import uuid
 import boto3
 from app.config import settings
@@ -19,49 +36,136 @@ import asyncio
 
 router = APIRouter()
 
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-    
-    async def connect(self, websocket: WebSocket, user_id: str):
-        await websocket.accept()
-        self.active_connections[user_id] = websocket
-        set_user_online(user_id)
+# Longest file_url the messages table stores
+FILE_URL_LENGTH = Message.__table__.c.file_url.type.length
+
+# Fields of MessageResponse, for history pages built without Pydantic validation
+MESSAGE_FIELDS = model_fields(MessageResponse)
+
+# Stream messages missed since a cursor to a freshly connected session
+#
+# The session is already receiving live messages, so a message can arrive
+# both live and in a resync batch; clients de-duplicate by message id.
+async def resync_connection(connection, since: int):
+    cursor = since
+    async for messages, cursor in iter_pending_batches(connection.user_id, since, settings.RESYNC_BATCH_SIZE):
+        await connection.send_message({
+            "type": "resync",
+            "data": {"messages": messages, "cursor": cursor}
+        })
     
-    def disconnect(self, user_id: str):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-        set_user_offline(user_id)
+    await connection.send_message({
+        "type": "resync_complete",
+        "data": {
+            "cursor": cursor,
+            # Older messages were trimmed from the index; fall back to the history endpoints
+            "truncated": await is_pending_index_truncated(connection.user_id, since)
+        }
+    })
+
+# Handle a read_receipt frame
+#
+# The frame names the newest message the user has read, either by
+# "message_id" or by its "cursor" plus "receiver_id" (the other user) or
+# "group_id". The reader's watermark moves up to it and the other side of
+# the conversation is told once, however many messages that covers.
+async def process_read_receipt(user_id: str, data: dict):
+    peer_id = None
+    group_id = None
+    message_id = data.get("message_id")
     
-    async def send_personal_message(self, message: dict, user_id: str):
-        if user_id in self.active_connections:
-            await self.active_connections[user_id].send_json(message)
+    async with AsyncSessionLocal() as db:
+        if message_id:
+            result = await db.execute(
+                select(Message.sender_id, Message.receiver_id, Message.group_id, Message.created_at)
+                .filter(Message.id == message_id)
+            )
+            message = result.first()
+            if message is None:
+                return
+            if message.group_id:
+                group_id = message.group_id
+            elif message.receiver_id == user_id:
+                peer_id = message.sender_id
+            else:
+                # Only received messages can be marked as read
+                return
+            read_up_to = message.created_at
+        else:
+            peer_id = data.get("receiver_id")
+            group_id = data.get("group_id")
+            read_up_to = min(cursor_to_datetime(int(data["cursor"])), datetime.utcnow())
+        
+        recipient_ids = []
+        channel = False
+        if group_id:
+            group = await membership_cache.get_group(group_id)
+            if group is None or user_id not in group[0]:
+                return
+            member_ids, delivery_mode = group
+            conversation_id = group_conversation_id(group_id)
+            channel = delivery_mode == GroupDeliveryMode.CHANNEL
+            recipient_ids = [member_id for member_id in member_ids if member_id != user_id]
+        elif peer_id:
+            conversation_id = direct_conversation_id(user_id, peer_id)
+            recipient_ids = [peer_id]
+        else:
+            return
+        
+        if not await advance_watermark(db, user_id, conversation_id, read_up_to, message_id):
+            return
+        await db.commit()
     
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections.values():
-            await connection.send_json(message)
-
-manager = ConnectionManager()
+    # Send read receipt to the other side of the conversation
+    read_receipt = {
+        "type": "read_receipt",
+        "data": {
+            "message_id": message_id,
+            "reader_id": user_id,
+            "receiver_id": peer_id,
+            "group_id": group_id,
+            "read_up_to": read_up_to.isoformat(),
+            "cursor": message_cursor(read_up_to)
+        }
+    }
+    if channel:
+        # Channel groups only tell the members watching the room
+        await manager.send_to_room(read_receipt, group_id, exclude_user_id=user_id)
+    else:
+        await manager.send_to_users(read_receipt, recipient_ids)
 
 # WebSocket endpoint
+#
+# Offer the "chat.msgpack" subprotocol for MessagePack binary frames
+# ("chat.json" or nothing for JSON text). Pass ?since=<cursor> (the "cursor" of the last message received) to have
+# every message missed while offline streamed before live traffic resumes.
+# Live messages of channel-mode groups are only sent to sessions that sent a
+# "subscribe" frame for the group (e.g. while it is open on screen).
 @router.websocket("/ws/{token}")
-async def websocket_endpoint(websocket: WebSocket, token: str, db: Session = Depends(get_db)):
+async def websocket_endpoint(websocket: WebSocket, token: str, since: Optional[int] = Query(None)):
     try:
-        # Authenticate user from token
-        user = await get_current_user(token=token, db=db)
+        # Authenticate user from token (sessions are opened per operation, not per connection)
+        async with AsyncSessionLocal() as db:
+            user = await get_current_user(token=token, db=db)
         
-        # Connect to WebSocket
-        await manager.connect(websocket, user.id)
+        # Connect to WebSocket (each tab or device gets its own session)
+        connection = await manager.connect(websocket, user.id)
         
         try:
+            # Catch up on anything missed since the client's last cursor
+            if since is not None:
+                await resync_connection(connection, since)
+            
             while True:
-                # Receive message from WebSocket
-                data = await websocket.receive_text()
-                message_data = json.loads(data)
+                # Receive message from WebSocket (decoded with the negotiated codec)
+                message_data = await connection.receive()
                 
                 # Process message based on type
-                if message_data["type"] == "message":
+                if message_data["type"] == "pong":
+                    # Heartbeat reply; receive() already recorded the activity
+                    continue
+                
+                elif message_data["type"] == "message":
                     # Create new message
                     message_create = MessageCreate(
                         content=message_data["data"]["content"],
@@ -71,176 +175,355 @@ async def websocket_endpoint(websocket: WebSocket, token: str, db: Session = Dep
                         group_id=message_data["data"].get("group_id")
                     )
                     
-                    # Save message to database
-                    db_message = Message(
-                        id=str(uuid.uuid4()),
-                        sender_id=user.id,
-                        receiver_id=message_create.receiver_id,
-                        group_id=message_create.group_id,
-                        content=message_create.content,
-                        message_type=message_create.message_type,
-                        file_url=message_create.file_url,
-                        status=MessageStatus.SENT
-                    )
+                    # Check the message can be stored before acknowledging it: with
+                    # write-behind the insert only happens after the ack, so a row
+                    # that fails there would be lost after everyone has seen it
+                    error = None
+                    group = None
+                    if not message_create.receiver_id and not message_create.group_id:
+                        error = "A message needs a receiver_id or a group_id"
+                    elif message_create.file_url and len(message_create.file_url) > FILE_URL_LENGTH:
+                        error = f"file_url is longer than {FILE_URL_LENGTH} characters"
+                    elif message_create.receiver_id and not await user_directory.exists(message_create.receiver_id):
+                        error = "Receiver not found"
+                    elif message_create.group_id:
+                        group = await membership_cache.get_group(message_create.group_id)
+                        if group is None or user.id not in group[0]:
+                            error = "Group not found or you are not a member"
+                    if error:
+                        await connection.send_message({"type": "error", "data": {"message": error}})
+                        continue
+                    
+                    # Assign the id and timestamp here so the message can be
+                    # delivered without waiting for the insert
+                    message_row = {
+                        "id": new_message_id(),
+                        "sender_id": user.id,
+                        "receiver_id": message_create.receiver_id,
+                        "group_id": message_create.group_id,
+                        "conversation_id": (
+                            direct_conversation_id(user.id, message_create.receiver_id)
+                            if message_create.receiver_id else None
+                        ),
+                        "content": message_create.content,
+                        "message_type": MessageType(message_create.message_type),
+                        "file_url": message_create.file_url,
+                        "status": MessageStatus.SENT,
+                        "created_at": datetime.utcnow()
+                    }
                     
-                    db.add(db_message)
-                    db.commit()
-                    db.refresh(db_message)
+                    # Save message to database now, unless the write-behind writer is running
+                    if not message_writer.running:
+                        async with AsyncSessionLocal() as db:
+                            db.add(Message(**message_row))
+                            await record_messages(db, [message_row])
+                            await db.commit()
                     
                     # Prepare response
                     response = {
                         "type": "message",
                         "data": {
-                            "id": db_message.id,
-                            "sender_id": db_message.sender_id,
-                            "receiver_id": db_message.receiver_id,
-                            "group_id": db_message.group_id,
-                            "content": db_message.content,
-                            "message_type": db_message.message_type.value,
-                            "file_url": db_message.file_url,
-                            "status": db_message.status.value,
-                            "created_at": db_message.created_at.isoformat()
+                            "id": message_row["id"],
+                            "sender_id": message_row["sender_id"],
+                            "receiver_id": message_row["receiver_id"],
+                            "group_id": message_row["group_id"],
+                            "content": message_row["content"],
+                            "message_type": message_row["message_type"].value,
+                            "file_url": message_row["file_url"],
+                            "status": message_row["status"].value,
+                            "created_at": message_row["created_at"].isoformat(),
+                            "cursor": message_cursor(message_row["created_at"])
                         }
                     }
                     
-                    # Send message to receiver if online
-                    if db_message.receiver_id:
-                        await manager.send_personal_message(response, db_message.receiver_id)
-                        
-                        # Update message status to delivered
-                        if is_user_online(db_message.receiver_id):
-                            db_message.status = MessageStatus.DELIVERED
-                            db.commit()
+                    # Work out who receives the message
+                    recipient_ids = []
+                    channel = False
+                    if message_row["receiver_id"]:
+                        recipient_ids = [message_row["receiver_id"]]
+                    elif message_row["group_id"]:
+                        # Member ids and delivery mode come from the membership cache
+                        member_ids, delivery_mode = group
+                        channel = delivery_mode == GroupDeliveryMode.CHANNEL
+                        if not channel:
+                            recipient_ids = [
+                                member_id for member_id in member_ids
+                                if member_id != user.id  # Don't send to sender
+                            ]
+                    
+                    # Record it for every participant so reconnecting sessions can resync
+                    # (channel members read the history instead)
+                    await index_pending_message(response["data"], recipient_ids + [user.id])
                     
-                    # Send message to group members if it's a group message
-                    elif db_message.group_id:
-                        # Get all group members
-                        group = db.query(Group).filter(Group.id == db_message.group_id).first()
-                        if group:
-                            for member in group.members:
-                                if member.user_id != user.id:  # Don't send to sender
-                                    await manager.send_personal_message(response, member.user_id)
+                    # Send message to the receiver or group members, encoding the frame once
+                    if channel:
+                        await manager.send_to_room(response, message_row["group_id"], exclude_user_id=user.id)
+                        delivered_ids = set()
+                    else:
+                        delivered_ids = await manager.send_to_users(response, recipient_ids)
+                    delivered = message_row["receiver_id"] in delivered_ids
                     
                     # Send confirmation to sender
                     await manager.send_personal_message(response, user.id)
+                    
+                    # Update message status to delivered (folded into the insert when writing behind)
+                    if message_writer.running:
+                        if delivered:
+                            message_row["status"] = MessageStatus.DELIVERED
+                        await message_writer.enqueue(message_row)
+                    elif delivered:
+                        async with AsyncSessionLocal() as db:
+                            await db.execute(
+                                update(Message)
+                                .filter(Message.id == message_row["id"])
+                                .values(status=MessageStatus.DELIVERED)
+                            )
+                            await db.commit()
                 
                 elif message_data["type"] == "typing":
-                    # Send typing status
-                    receiver_id = message_data["data"]["receiver_id"]
-                    typing_status = {
-                        "type": "typing",
-                        "data": {
-                            "sender_id": user.id,
-                            "receiver_id": receiver_id,
-                            "is_typing": message_data["data"]["is_typing"]
-                        }
-                    }
-                    await manager.send_personal_message(typing_status, receiver_id)
+                    # Coalesce keystroke events; only typing/stopped transitions are sent on
+                    typing_data = message_data["data"]
+                    if typing_data.get("group_id"):
+                        conversation = ("group", typing_data["group_id"])
+                    else:
+                        conversation = ("user", typing_data["receiver_id"])
+                    typing_tracker.update(user.id, conversation, bool(typing_data["is_typing"]))
                 
                 elif message_data["type"] == "read_receipt":
-                    # Update message status to read
-                    message_id = message_data["data"]["message_id"]
-                    message = db.query(Message).filter(Message.id == message_id).first()
-                    
-                    if message and message.receiver_id == user.id:
-                        message.status = MessageStatus.READ
-                        db.commit()
-                        
-                        # Send read receipt to sender
-                        read_receipt = {
-                            "type": "read_receipt",
-                            "data": {
-                                "message_id": message_id,
-                                "reader_id": user.id
-                            }
-                        }
-                        await manager.send_personal_message(read_receipt, message.sender_id)
+                    # Advance the read watermark; one receipt covers every earlier message
+                    await process_read_receipt(user.id, message_data["data"])
+                
+                elif message_data["type"] == "subscribe":
+                    # Watch a group's room (members only)
+                    group_id = message_data["data"]["group_id"]
+                    member_ids = await membership_cache.get_members(group_id)
+                    if member_ids is not None and user.id in member_ids:
+                        await manager.subscribe_room(connection, group_id)
+                        await connection.send_message({"type": "subscribed", "data": {"group_id": group_id}})
+                
+                elif message_data["type"] == "unsubscribe":
+                    await manager.unsubscribe_room(connection, message_data["data"]["group_id"])
         
         except WebSocketDisconnect:
-            manager.disconnect(user.id)
+            pass
+        finally:
+            # Always release the session, whatever ended the receive loop
+            await manager.disconnect(connection)
+            if user.id not in manager.active_connections:
+                typing_tracker.clear_sender(user.id)
         
     except Exception as e:
         await websocket.close(code=1008)
 
+# WebSocket delivery statistics (sessions, queue depth, fan-out latency, write-behind queue, typing, membership cache)
+@router.get("/stats")
+async def get_chat_stats(current_user: User = Depends(get_current_active_user)):
+    return {
+        **manager.stats(),
+        "persistence": message_writer.stats(),
+        "typing": typing_tracker.stats(),
+        "membership_cache": membership_cache.stats()
+    }
+
+# List the current user's conversations, most recent activity first
+#
+# Served from the conversations read-model in one index range scan. Pass the
+# returned next_cursor as `before` for the next page.
+@router.get("/conversations", response_model=ConversationList)
+async def get_conversations(
+    limit: int = Query(20, ge=1, le=100),
+    before: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    query = select(Conversation).filter(Conversation.user_id == current_user.id)
+    if before:
+        try:
+            last_message_at, conversation_id = decode_keyset_cursor(before)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        query = query.filter(
+            (Conversation.last_message_at < last_message_at) | (
+                (Conversation.last_message_at == last_message_at) &
+                (Conversation.conversation_id < conversation_id)
+            )
+        )
+    
+    result = await db.execute(
+        query.order_by(Conversation.last_message_at.desc(), Conversation.conversation_id.desc())
+        .limit(limit + 1)
+    )
+    conversations = list(result.scalars())
+    
+    next_cursor = None
+    if len(conversations) > limit:
+        conversations = conversations[:limit]
+        last = conversations[-1]
+        next_cursor = encode_keyset_cursor(last.last_message_at, last.conversation_id)
+    
+    return {"conversations": conversations, "next_cursor": next_cursor}
+
+# Search message content in the current user's conversations, best match first
+#
+# Optionally limited to one conversation (a conversation_id as returned by
+# /chat/conversations).
+@router.get("/search", response_model=SearchResponse)
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    conversation_id: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    # Messages come from the read replica; watermarks stay on the primary
+    results = await search_messages(read_db, current_user.id, q, limit, conversation_id)
+    
+    # Derive read status from watermarks, as the history endpoints do
+    watermarks = await get_receiver_watermarks(db, [message for message, _ in results])
+    search_results = []
+    for message, hit in results:
+        message_response = row_to_dict(message, MESSAGE_FIELDS)
+        message_response["status"] = derive_status(message, watermarks.get(message.conversation_id, {}))
+        search_results.append({"message": message_response, "snippet": hit.snippet, "rank": hit.rank})
+    return {"results": search_results}
+
+# Export a whole conversation (archived and hot messages) as NDJSON, oldest first
+#
+# The response is streamed from a server-side cursor, so exports of any size
+# use constant memory. conversation_id is as returned by /chat/conversations.
+@router.get("/conversations/{conversation_id}/export")
+async def export_conversation(
+    conversation_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    if not await can_export(current_user.id, conversation_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found"
+        )
+    
+    return StreamingResponse(
+        iter_conversation_ndjson(conversation_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{conversation_id.replace(":", "_")}.ndjson"'}
+    )
+
 # Get chat history with a specific user
+#
+# Pass the returned next_cursor as `before` to scroll back (or as `after`
+# when paging forward); `skip` is only kept for older clients. `total` is
+# only counted with include_total=true.
 @router.get("/messages/{user_id}", response_model=MessageList)
 async def get_chat_history(
     user_id: str,
     skip: int = 0,
     limit: int = 50,
-    db: Session = Depends(get_db),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    include_total: bool = False,
+    db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
+    # Both directions share one conversation key, so this is a single index range
+    conversation_id = direct_conversation_id(current_user.id, user_id)
+    conversation_filter = Message.conversation_id == conversation_id
+    
     # Get messages between current user and specified user
-    messages = db.query(Message).filter(
-        (
-            (Message.sender_id == current_user.id) & 
-            (Message.receiver_id == user_id)
-        ) | (
-            (Message.sender_id == user_id) & 
-            (Message.receiver_id == current_user.id)
-        )
-    ).order_by(Message.created_at.desc()).offset(skip).limit(limit).all()
+    # Messages come from the read replica; watermarks stay on the primary
+    messages, next_cursor = await fetch_message_page(
+        read_db, conversation_filter, limit, before, after, skip, conversation_id
+    )
     
-    # Count total messages
-    total = db.query(Message).filter(
-        (
-            (Message.sender_id == current_user.id) & 
-            (Message.receiver_id == user_id)
-        ) | (
-            (Message.sender_id == user_id) & 
-            (Message.receiver_id == current_user.id)
-        )
-    ).count()
+    # Count total messages only when asked; paging itself never needs it
+    total = None
+    if include_total:
+        total = await read_db.scalar(select(func.count()).select_from(Message).filter(conversation_filter))
     
-    # Mark received messages as read
-    for message in messages:
-        if message.receiver_id == current_user.id and message.status != MessageStatus.READ:
-            message.status = MessageStatus.READ
+    # Mark received messages as read by moving the watermark once
+    newest_received = max(
+        (message.created_at for message in messages if message.receiver_id == current_user.id),
+        default=None
+    )
+    if newest_received is not None:
+        if await advance_watermark(db, current_user.id, conversation_id, newest_received):
+            await db.commit()
     
-    db.commit()
+    # Derive read status from both participants' watermarks
+    watermarks = await get_watermarks(db, conversation_id, [current_user.id, user_id])
+    message_responses = []
+    for message in messages:
+        message_response = row_to_dict(message, MESSAGE_FIELDS)
+        message_response["status"] = derive_status(message, watermarks)
+        message_responses.append(message_response)
     
-    return {"messages": messages, "total": total}
+    return FastJSONResponse({
+        "messages": message_responses,
+        "total": total,
+        "next_cursor": next_cursor,
+        "read_up_to": watermarks.get(current_user.id)
+    })
 
-# Get group chat history
+# Get group chat history (paged like get_chat_history)
 @router.get("/groups/{group_id}/messages", response_model=MessageList)
 async def get_group_chat_history(
     group_id: str,
     skip: int = 0,
     limit: int = 50,
-    db: Session = Depends(get_db),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    include_total: bool = False,
+    db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
     # Check if user is a member of the group
-    group = db.query(Group).filter(Group.id == group_id).first()
-    if not group:
+    members = await membership_cache.get_members(group_id)
+    if members is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Group not found"
         )
     
-    is_member = any(member.user_id == current_user.id for member in group.members)
-    if not is_member:
+    if current_user.id not in members:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You are not a member of this group"
         )
     
     # Get group messages
-    messages = db.query(Message).filter(
-        Message.group_id == group_id
-    ).order_by(Message.created_at.desc()).offset(skip).limit(limit).all()
+    # Messages come from the read replica; watermarks stay on the primary
+    messages, next_cursor = await fetch_message_page(
+        read_db, Message.group_id == group_id, limit, before, after, skip, group_conversation_id(group_id)
+    )
+    
+    # Count total messages only when asked; paging itself never needs it
+    total = None
+    if include_total:
+        total = await read_db.scalar(select(func.count()).select_from(Message).filter(Message.group_id == group_id))
     
-    # Count total messages
-    total = db.query(Message).filter(Message.group_id == group_id).count()
+    # Viewing the newest messages moves the caller's group watermark
+    conversation_id = group_conversation_id(group_id)
+    if messages and await advance_watermark(db, current_user.id, conversation_id, messages[0].created_at):
+        await db.commit()
+    watermarks = await get_watermarks(db, conversation_id, [current_user.id])
     
-    return {"messages": messages, "total": total}
+    return FastJSONResponse({
+        "messages": [row_to_dict(message, MESSAGE_FIELDS) for message in messages],
+        "total": total,
+        "next_cursor": next_cursor,
+        "read_up_to": watermarks.get(current_user.id)
+    })
 
 # Upload file for chat
 @router.post("/upload-file", response_model=FileUploadResponse)
 async def upload_file(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     try:
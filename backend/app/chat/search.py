@@ -0,0 +1,251 @@
+from sqlalchemy import select, text, bindparam, inspect, or_
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.models import Message, Conversation, GroupMember, group_conversation_id
+from typing import List, Optional, Tuple
+import re
+
+# Full-text message search
+#
+# Each backend keeps its index up to date inside the database itself, so
+# message inserts and deletes (including write-behind batches) need no extra
+# work in the application:
+#
+# - "fts5": an SQLite FTS5 table over messages.content, maintained by triggers
+# - "mysql": a MySQL FULLTEXT index on messages.content
+# - "like": no index, LIKE over the caller's conversations (fallback only)
+#
+# SEARCH_BACKEND=auto picks fts5 or mysql from the database URL. Searches are
+# always limited to the caller's direct conversations and current groups.
+# Every backend returns snippets as plain text with no highlight markup.
+
+# Characters of context shown around a match by backends without native snippets
+SNIPPET_CONTEXT = 60
+
+class SearchHit:
+    def __init__(self, message_id: str, snippet: str, rank: float):
+        self.message_id = message_id
+        self.snippet = snippet
+        self.rank = rank
+
+# Conversations a user may search: direct conversations and current groups
+async def get_search_scope(db: AsyncSession, user_id: str) -> Tuple[List[str], List[str]]:
+    result = await db.execute(
+        select(Conversation.conversation_id).filter(
+            Conversation.user_id == user_id,
+            Conversation.peer_id.isnot(None)
+        )
+    )
+    conversation_ids = list(result.scalars())
+    result = await db.execute(select(GroupMember.group_id).filter(GroupMember.user_id == user_id))
+    group_ids = list(result.scalars())
+    return conversation_ids, group_ids
+
+# Split a user query into words (punctuation is never passed to the engine)
+def query_terms(query: str) -> List[str]:
+    return re.findall(r"\w+", query)
+
+# Plain-text snippet around the first matching term
+def make_snippet(content: str, terms: List[str]) -> str:
+    lowered = content.lower()
+    positions = [lowered.find(term.lower()) for term in terms]
+    positions = [position for position in positions if position >= 0]
+    start = max(min(positions, default=0) - SNIPPET_CONTEXT, 0)
+    end = start + 2 * SNIPPET_CONTEXT
+    return ("…" if start else "") + content[start:end] + ("…" if end < len(content) else "")
+
+# The FTS5 table is an external-content index keyed on the implicit rowid of
+# messages (its primary key is a VARCHAR, so there is no INTEGER PRIMARY KEY
+# to use instead). VACUUM may renumber those rowids, after which the index
+# points at the wrong rows until it is rebuilt: vacuum through
+# vacuum_database(), which rebuilds it straight away.
+class FTS5Backend:
+    name = "fts5"
+
+    # Create the FTS table and its triggers; fill it if it is new
+    def create_index(self, conn: Connection):
+        if "messages_fts" in inspect(conn).get_table_names():
+            return
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE messages_fts USING fts5("
+            "content, content='messages', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2')"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN "
+            "INSERT INTO messages_fts(rowid, content) VALUES (new.rowid, new.content); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN "
+            "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.rowid, old.content); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER messages_fts_update AFTER UPDATE OF content ON messages BEGIN "
+            "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.rowid, old.content); "
+            "INSERT INTO messages_fts(rowid, content) VALUES (new.rowid, new.content); END"
+        ))
+        self.rebuild(conn)
+
+    def rebuild(self, conn: Connection):
+        conn.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+
+    async def search(
+        self, db: AsyncSession, terms: List[str], conversation_ids: List[str], group_ids: List[str], limit: int
+    ) -> List[SearchHit]:
+        # Every word must match; the last one also matches as a prefix
+        match = " ".join(f'"{term}"' for term in terms) + "*"
+        result = await db.execute(
+            text(
+                "SELECT m.id, snippet(messages_fts, 0, '', '', '…', 12) AS snippet, "
+                "bm25(messages_fts) AS rank "
+                "FROM messages_fts JOIN messages m ON m.rowid = messages_fts.rowid "
+                "WHERE messages_fts MATCH :match AND NOT coalesce(m.is_deleted, 0) "
+                "AND (m.conversation_id IN :conversation_ids OR m.group_id IN :group_ids) "
+                "ORDER BY rank LIMIT :limit"
+            ).bindparams(
+                bindparam("conversation_ids", expanding=True),
+                bindparam("group_ids", expanding=True)
+            ),
+            {
+                "match": match,
+                "conversation_ids": conversation_ids,
+                "group_ids": group_ids,
+                "limit": limit
+            }
+        )
+        return [SearchHit(row.id, row.snippet, row.rank) for row in result]
+
+class MySQLFullTextBackend:
+    name = "mysql"
+
+    def create_index(self, conn: Connection):
+        indexes = {index["name"] for index in inspect(conn).get_indexes("messages")}
+        if "ft_messages_content" not in indexes:
+            conn.execute(text("CREATE FULLTEXT INDEX ft_messages_content ON messages (content)"))
+
+    # InnoDB maintains FULLTEXT indexes on write; OPTIMIZE merges pending changes
+    def rebuild(self, conn: Connection):
+        conn.execute(text("OPTIMIZE TABLE messages"))
+
+    async def search(
+        self, db: AsyncSession, terms: List[str], conversation_ids: List[str], group_ids: List[str], limit: int
+    ) -> List[SearchHit]:
+        match = " ".join(f"+{term}" for term in terms) + "*"
+        result = await db.execute(
+            text(
+                "SELECT id, content, MATCH(content) AGAINST (:match IN BOOLEAN MODE) AS score "
+                "FROM messages "
+                "WHERE MATCH(content) AGAINST (:match IN BOOLEAN MODE) AND NOT coalesce(is_deleted, 0) "
+                "AND (conversation_id IN :conversation_ids OR group_id IN :group_ids) "
+                "ORDER BY score DESC LIMIT :limit"
+            ).bindparams(
+                bindparam("conversation_ids", expanding=True),
+                bindparam("group_ids", expanding=True)
+            ),
+            {
+                "match": match,
+                "conversation_ids": conversation_ids,
+                "group_ids": group_ids,
+                "limit": limit
+            }
+        )
+        return [SearchHit(row.id, make_snippet(row.content, terms), -row.score) for row in result]
+
+class LikeBackend:
+    name = "like"
+
+    def create_index(self, conn: Connection):
+        pass
+
+    def rebuild(self, conn: Connection):
+        pass
+
+    async def search(
+        self, db: AsyncSession, terms: List[str], conversation_ids: List[str], group_ids: List[str], limit: int
+    ) -> List[SearchHit]:
+        result = await db.execute(
+            select(Message.id, Message.content)
+            .filter(
+                or_(Message.conversation_id.in_(conversation_ids), Message.group_id.in_(group_ids)),
+                *[Message.content.contains(term, autoescape=True) for term in terms]
+            )
+            .order_by(Message.created_at.desc())
+            .limit(limit)
+        )
+        return [SearchHit(row.id, make_snippet(row.content, terms), 0.0) for row in result]
+
+BACKENDS = {backend.name: backend for backend in (FTS5Backend(), MySQLFullTextBackend(), LikeBackend())}
+
+# Backend for the configured database (None when search is disabled)
+def get_search_backend():
+    name = settings.SEARCH_BACKEND
+    if name == "none":
+        return None
+    if name == "auto":
+        scheme = settings.DATABASE_URL.split("://", 1)[0]
+        name = "fts5" if scheme.startswith("sqlite") else "mysql" if scheme.startswith("mysql") else "like"
+    return BACKENDS[name]
+
+# Search messages visible to a user, best match first
+async def search_messages(
+    db: AsyncSession, user_id: str, query: str, limit: int, conversation_id: Optional[str] = None
+) -> List[Tuple[Message, SearchHit]]:
+    backend = get_search_backend()
+    terms = query_terms(query)
+    if backend is None or not terms:
+        return []
+
+    conversation_ids, group_ids = await get_search_scope(db, user_id)
+    if conversation_id is not None:
+        # Narrow to one conversation the user can see
+        conversation_ids = [cid for cid in conversation_ids if cid == conversation_id]
+        group_ids = [gid for gid in group_ids if group_conversation_id(gid) == conversation_id]
+    if not conversation_ids and not group_ids:
+        return []
+
+    hits = await backend.search(db, terms, conversation_ids, group_ids, limit)
+    if not hits:
+        return []
+    result = await db.execute(select(Message).filter(Message.id.in_([hit.message_id for hit in hits])))
+    messages = {message.id: message for message in result.scalars()}
+    return [(messages[hit.message_id], hit) for hit in hits if hit.message_id in messages]
+
+# Create the search index for the configured backend (called from migrations)
+def create_search_index(conn: Connection):
+    backend = get_search_backend()
+    if backend is not None:
+        backend.create_index(conn)
+
+# VACUUM an SQLite database, then rebuild the FTS5 index it may have invalidated
+#
+# VACUUM cannot run inside a transaction, so conn must be in autocommit mode.
+def vacuum_database(conn: Connection):
+    conn.execute(text("VACUUM"))
+    backend = get_search_backend()
+    if backend is not None and backend.name == "fts5":
+        backend.create_index(conn)
+        backend.rebuild(conn)
+
+if __name__ == "__main__":
+    # python -m app.chat.search rebuild
+    # python -m app.chat.search vacuum   (SQLite: VACUUM, then rebuild the index)
+    import sys
+    from app.database import engine
+    command = sys.argv[1:]
+    if command == ["vacuum"]:
+        if engine.dialect.name != "sqlite":
+            sys.exit("vacuum only applies to SQLite databases")
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            vacuum_database(conn)
+        print("Vacuumed the database and rebuilt the search index")
+        sys.exit()
+    if command != ["rebuild"]:
+        sys.exit("usage: python -m app.chat.search rebuild | vacuum")
+    backend = get_search_backend()
+    if backend is None:
+        sys.exit("Search is disabled (SEARCH_BACKEND=none)")
+    with engine.connect() as conn:
+        backend.create_index(conn)
+        backend.rebuild(conn)
+        conn.commit()
+    print(f"Rebuilt {backend.name} search index")
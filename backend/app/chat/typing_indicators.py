@@ -0,0 +1,148 @@
+from app.config import settings
+from app.chat.manager import manager
+from app.chat.membership import membership_cache
+from app.models import GroupDeliveryMode
+from typing import Dict, Optional, Set, Tuple
+import asyncio
+import time
+
+# A conversation is ("user", receiver_id) or ("group", group_id)
+Conversation = Tuple[str, str]
+
+class TypingState:
+    def __init__(self):
+        self.typing = False
+        self.announced = False
+        self.last_emit = 0.0
+        self.expiry_handle: Optional[asyncio.TimerHandle] = None
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+
+# Typing-state tracker
+#
+# Clients may send a typing event for every keystroke. The tracker keeps one
+# state per (sender, conversation) and only sends the other side transitions
+# between typing and not typing. A state that is not refreshed within
+# expiry seconds falls back to not typing on its own. Group conversations
+# are also throttled: one sender produces at most one update per
+# group_min_interval seconds, and the latest state is sent once the
+# interval is over.
+class TypingTracker:
+    def __init__(self, expiry: float = 6.0, group_min_interval: float = 3.0):
+        self.expiry = expiry
+        self.group_min_interval = group_min_interval
+        self.states: Dict[Tuple[str, Conversation], TypingState] = {}
+        self.received = 0
+        self.emitted = 0
+        # Updates being sent (the loop only keeps weak references to tasks)
+        self.emit_tasks: Set[asyncio.Task] = set()
+
+    # Record a typing event from a client
+    def update(self, sender_id: str, conversation: Conversation, is_typing: bool):
+        self.received += 1
+        key = (sender_id, conversation)
+        state = self.states.get(key)
+        if state is None:
+            if not is_typing:
+                return
+            state = self.states[key] = TypingState()
+
+        state.typing = is_typing
+        if state.expiry_handle is not None:
+            state.expiry_handle.cancel()
+            state.expiry_handle = None
+        if is_typing:
+            state.expiry_handle = asyncio.get_running_loop().call_later(self.expiry, self._expire, key)
+        self._schedule(key)
+
+    # Stop every typing state of a sender (e.g. their last session closed)
+    def clear_sender(self, sender_id: str):
+        for key in [key for key in self.states if key[0] == sender_id]:
+            self.update(sender_id, key[1], False)
+
+    def _expire(self, key):
+        state = self.states.get(key)
+        if state is not None:
+            state.expiry_handle = None
+            state.typing = False
+            self._schedule(key)
+
+    # Announce the current state now, later (when throttled) or not at all
+    def _schedule(self, key):
+        state = self.states.get(key)
+        if state is None:
+            return
+        if state.typing == state.announced:
+            if state.flush_handle is not None:
+                state.flush_handle.cancel()
+                state.flush_handle = None
+            if not state.typing:
+                del self.states[key]
+            return
+
+        min_interval = self.group_min_interval if key[1][0] == "group" else 0
+        wait = state.last_emit + min_interval - time.monotonic()
+        if wait > 0:
+            if state.flush_handle is None:
+                state.flush_handle = asyncio.get_running_loop().call_later(wait, self._flush, key)
+            return
+
+        state.announced = state.typing
+        state.last_emit = time.monotonic()
+        self.emitted += 1
+        sender_id, conversation = key
+        task = asyncio.create_task(self._emit(sender_id, conversation, state.typing))
+        self.emit_tasks.add(task)
+        task.add_done_callback(self.emit_tasks.discard)
+        if not state.typing:
+            del self.states[key]
+
+    def _flush(self, key):
+        state = self.states.get(key)
+        if state is not None:
+            state.flush_handle = None
+            self._schedule(key)
+
+    async def _emit(self, sender_id: str, conversation: Conversation, is_typing: bool):
+        try:
+            kind, conversation_id = conversation
+            if kind == "user":
+                await manager.send_personal_message({
+                    "type": "typing",
+                    "data": {
+                        "sender_id": sender_id,
+                        "receiver_id": conversation_id,
+                        "is_typing": is_typing
+                    }
+                }, conversation_id)
+                return
+
+            group = await membership_cache.get_group(conversation_id)
+            if group is None or sender_id not in group[0]:
+                return
+            member_ids, delivery_mode = group
+            typing = {
+                "type": "typing",
+                "data": {
+                    "sender_id": sender_id,
+                    "group_id": conversation_id,
+                    "is_typing": is_typing
+                }
+            }
+            if delivery_mode == GroupDeliveryMode.CHANNEL:
+                await manager.send_to_room(typing, conversation_id, exclude_user_id=sender_id)
+            else:
+                await manager.send_to_users(typing, [member_id for member_id in member_ids if member_id != sender_id])
+        except Exception as e:
+            print(f"Error sending typing status: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self.states),
+            "received": self.received,
+            "emitted": self.emitted
+        }
+
+typing_tracker = TypingTracker(
+    expiry=settings.TYPING_EXPIRY_SECONDS,
+    group_min_interval=settings.TYPING_GROUP_MIN_INTERVAL_SECONDS
+)
@@ -15,6 +15,27 @@ class Settings(BaseSettings):
     
     # Database settings
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./chatapp.db")
+    # Async driver URL; derived from DATABASE_URL when empty (sqlite -> aiosqlite, mysql -> aiomysql)
+    ASYNC_DATABASE_URL: str = os.getenv("ASYNC_DATABASE_URL", "")
+    # Optional read replica for read-only endpoints (async URL derived the same way when empty)
+    READ_REPLICA_URL: str = os.getenv("READ_REPLICA_URL", "")
+    ASYNC_READ_REPLICA_URL: str = os.getenv("ASYNC_READ_REPLICA_URL", "")
+    
+    # Connection pool settings (ignored for SQLite, which does not use a sized pool)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+    # Recycle connections before the server's idle timeout closes them (MySQL wait_timeout)
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    
+    # SQLite PRAGMAs applied to every new connection
+    SQLITE_JOURNAL_MODE: str = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    # Negative values are KiB (-64000 is about 64 MB of page cache per connection)
+    SQLITE_CACHE_SIZE: int = int(os.getenv("SQLITE_CACHE_SIZE", "-64000"))
+    SQLITE_MMAP_SIZE: int = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
     
     # JWT settings
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7")
@@ -27,6 +48,61 @@ class Settings(BaseSettings):
     REDIS_DB: int = int(os.getenv("REDIS_DB", "0"))
     REDIS_PASSWORD: str = os.getenv("REDIS_PASSWORD", "")
     
+    # WebSocket settings
+    # "memory" keeps delivery inside one process; "redis" fans out across workers via pub/sub
+    WEBSOCKET_BROKER: str = os.getenv("WEBSOCKET_BROKER", "memory")
+    WEBSOCKET_CHANNEL_PREFIX: str = os.getenv("WEBSOCKET_CHANNEL_PREFIX", "ws")
+    # Outbound frames buffered per connection before the overflow policy applies
+    WEBSOCKET_SEND_QUEUE_SIZE: int = int(os.getenv("WEBSOCKET_SEND_QUEUE_SIZE", "256"))
+    # "drop_ephemeral" drops typing events and disconnects on anything else,
+    # "disconnect" disconnects on any overflow, "drop" never disconnects
+    WEBSOCKET_OVERFLOW_POLICY: str = os.getenv("WEBSOCKET_OVERFLOW_POLICY", "drop_ephemeral")
+    # Maximum number of concurrent publishes during a group fan-out
+    WEBSOCKET_FANOUT_CONCURRENCY: int = int(os.getenv("WEBSOCKET_FANOUT_CONCURRENCY", "64"))
+    # Offer permessage-deflate compression when running via python main.py
+    WEBSOCKET_PER_MESSAGE_DEFLATE: bool = os.getenv("WEBSOCKET_PER_MESSAGE_DEFLATE", "true").lower() == "true"
+    
+    # Heartbeat and presence settings
+    WEBSOCKET_HEARTBEAT_SECONDS: int = int(os.getenv("WEBSOCKET_HEARTBEAT_SECONDS", "25"))
+    # Sessions that send nothing (not even a pong) for this long are closed
+    WEBSOCKET_IDLE_TIMEOUT_SECONDS: int = int(os.getenv("WEBSOCKET_IDLE_TIMEOUT_SECONDS", "75"))
+    PRESENCE_TTL_SECONDS: int = int(os.getenv("PRESENCE_TTL_SECONDS", "60"))
+    
+    # Group membership cache (per worker; invalidated across workers with the "redis" broker)
+    MEMBERSHIP_CACHE_SIZE: int = int(os.getenv("MEMBERSHIP_CACHE_SIZE", "10000"))
+    MEMBERSHIP_CACHE_TTL_SECONDS: float = float(os.getenv("MEMBERSHIP_CACHE_TTL_SECONDS", "60"))
+    
+    # Cold storage: messages older than ARCHIVE_AFTER_DAYS move to gzip archive segments (0 disables archiving)
+    ARCHIVE_AFTER_DAYS: int = int(os.getenv("ARCHIVE_AFTER_DAYS", "0"))
+    ARCHIVE_DIR: str = os.getenv("ARCHIVE_DIR", "archive")
+    ARCHIVE_BATCH_SIZE: int = int(os.getenv("ARCHIVE_BATCH_SIZE", "5000"))
+    # Most messages per segment file (a history page decodes only the segments it touches)
+    ARCHIVE_SEGMENT_MESSAGES: int = int(os.getenv("ARCHIVE_SEGMENT_MESSAGES", "1000"))
+    # Decoded segments kept in memory per worker for history reads
+    ARCHIVE_CACHE_SEGMENTS: int = int(os.getenv("ARCHIVE_CACHE_SEGMENTS", "64"))
+    
+    # Message search: "auto" (FTS5 on SQLite, FULLTEXT on MySQL), "fts5", "mysql", "like" or "none"
+    SEARCH_BACKEND: str = os.getenv("SEARCH_BACKEND", "auto")
+    
+    # Typing indicator settings
+    # A typing state expires (and "stopped typing" is sent) after this long without a keystroke event
+    TYPING_EXPIRY_SECONDS: float = float(os.getenv("TYPING_EXPIRY_SECONDS", "6"))
+    # Minimum time between typing updates fanned out to a group for one sender
+    TYPING_GROUP_MIN_INTERVAL_SECONDS: float = float(os.getenv("TYPING_GROUP_MIN_INTERVAL_SECONDS", "3"))
+    
+    # Reconnect resync settings (per-user index of recent messages kept in Redis)
+    PENDING_INDEX_SIZE: int = int(os.getenv("PENDING_INDEX_SIZE", "1000"))
+    PENDING_TTL_SECONDS: int = int(os.getenv("PENDING_TTL_SECONDS", str(7 * 24 * 60 * 60)))  # 7 days
+    RESYNC_BATCH_SIZE: int = int(os.getenv("RESYNC_BATCH_SIZE", "100"))
+    
+    # Message persistence settings
+    # When enabled, WebSocket messages are acknowledged and delivered before they are
+    # written, and a background task inserts them in batches
+    MESSAGE_WRITE_BEHIND: bool = os.getenv("MESSAGE_WRITE_BEHIND", "false").lower() == "true"
+    MESSAGE_WRITE_BATCH_SIZE: int = int(os.getenv("MESSAGE_WRITE_BATCH_SIZE", "500"))
+    MESSAGE_WRITE_FLUSH_MS: int = int(os.getenv("MESSAGE_WRITE_FLUSH_MS", "50"))
+    MESSAGE_WRITE_QUEUE_SIZE: int = int(os.getenv("MESSAGE_WRITE_QUEUE_SIZE", "10000"))
+    
     # Celery settings
     CELERY_BROKER_URL: str = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
     CELERY_RESULT_BACKEND: str = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
@@ -1,13 +1,77 @@
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import create_engine, event, MetaData
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
 
-# Create SQLAlchemy engine
-engine = create_engine(settings.DATABASE_URL)
+# Async drivers used for each sync driver scheme
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
 
-# Create session factory
+# Derive an async database URL from a sync one (or use the explicit override)
+def to_async_url(url: str, override: str = "") -> str:
+    if override:
+        return override
+    scheme, rest = url.split("://", 1)
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}://{rest}"
+
+def get_async_database_url() -> str:
+    return to_async_url(settings.DATABASE_URL, settings.ASYNC_DATABASE_URL)
+
+# Engine keyword arguments for a database URL
+def engine_options(url: str) -> dict:
+    options = {"pool_pre_ping": settings.DB_POOL_PRE_PING}
+    if not url.startswith("sqlite"):
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE
+        )
+    return options
+
+# Apply the configured PRAGMAs to each new SQLite connection
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA cache_size={int(settings.SQLITE_CACHE_SIZE)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.close()
+
+def make_engine(url: str):
+    engine = create_engine(url, **engine_options(url))
+    if url.startswith("sqlite"):
+        event.listen(engine, "connect", set_sqlite_pragmas)
+    return engine
+
+def make_async_engine(url: str):
+    engine = create_async_engine(url, **engine_options(url))
+    if url.startswith("sqlite"):
+        event.listen(engine.sync_engine, "connect", set_sqlite_pragmas)
+    return engine
+
+# Create SQLAlchemy engines (the sync engine is kept for scripts and maintenance tasks)
+engine = make_engine(settings.DATABASE_URL)
+async_engine = make_async_engine(get_async_database_url())
+
+# Read-only endpoints use the replica when one is configured, the primary otherwise
+if settings.READ_REPLICA_URL or settings.ASYNC_READ_REPLICA_URL:
+    read_async_engine = make_async_engine(to_async_url(settings.READ_REPLICA_URL, settings.ASYNC_READ_REPLICA_URL))
+else:
+    read_async_engine = async_engine
+
+# Create session factories
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+ReadSessionLocal = async_sessionmaker(bind=read_async_engine, autoflush=False, expire_on_commit=False)
 
 # Base class for models
 Base = declarative_base()
@@ -16,13 +80,23 @@ Base = declarative_base()
 metadata = MetaData()
 
 # Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Dependency to get a read-only DB session (replica when configured)
+#
+# Replicas can lag behind the primary, so only use it for reads that may be
+# slightly stale, and never write through it.
+async def get_read_db():
+    async with ReadSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-# Create all tables in the database
-def create_tables():
-    Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+# Create all tables in the database, then upgrade tables created by older versions
+async def create_tables():
+    from app.migrations import run_migrations
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_engine.connect() as conn:
+        await conn.run_sync(run_migrations)
+        await conn.commit()
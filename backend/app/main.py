@@ -7,6 +7,9 @@ from app.api.routes import router as api_router
 from app.auth.routes import router as auth_router
 from app.chat.routes import router as chat_router
 from app.chat.group_routes import router as group_router
+from app.chat.manager import manager
+from app.chat.persistence import message_writer
+from app.chat.membership import membership_cache
 from app.database import create_tables
 from app.config import settings
 
@@ -34,7 +37,18 @@ app.include_router(group_router, prefix="/chat", tags=["Groups"])
 # Create database tables on startup
 @app.on_event("startup")
 async def startup_event():
-    create_tables()
+    await create_tables()
+    await manager.start()
+    await membership_cache.start()
+    if settings.MESSAGE_WRITE_BEHIND:
+        await message_writer.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await manager.stop()
+    await membership_cache.stop()
+    # Flush messages that were delivered but not yet written
+    await message_writer.stop()
 
 @app.get("/", tags=["Root"])
 async def root():
@@ -50,4 +64,7 @@ async def http_exception_handler(request, exc):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    uvicorn.run(
+        "app.main:app", host="0.0.0.0", port=8000, reload=True,
+        ws_per_message_deflate=settings.WEBSOCKET_PER_MESSAGE_DEFLATE
+    ) 
\ No newline at end of file
@@ -0,0 +1,224 @@
+from sqlalchemy import inspect, select, update, insert, case, literal, text, func
+from sqlalchemy.engine import Connection
+from app.models import (
+    Message, MessageStatus, Conversation, Group, GroupMember, GroupDeliveryMode,
+    ReadWatermark, group_conversation_id
+)
+from app.chat.conversations import PREVIEW_LENGTH
+from app.chat.search import create_search_index
+
+# In-place schema upgrades for databases created before a column or index
+# existed. create_all only creates missing tables, so each upgrade checks the
+# live schema and applies what is missing. Every step is idempotent and runs
+# from create_tables() on startup; on large databases run it once beforehand
+# with `python -m app.migrations` so startup is not held up by a backfill.
+
+# Rows updated per statement while backfilling
+BACKFILL_BATCH_SIZE = 10000
+
+# Add messages.conversation_id and the history and archive indexes, then backfill direct messages
+def upgrade_messages(conn: Connection):
+    inspector = inspect(conn)
+    if "messages" not in inspector.get_table_names():
+        return
+
+    columns = {column["name"] for column in inspector.get_columns("messages")}
+    if "conversation_id" not in columns:
+        conn.execute(text("ALTER TABLE messages ADD COLUMN conversation_id VARCHAR(80)"))
+
+    for index in Message.__table__.indexes:
+        index.create(bind=conn, checkfirst=True)
+
+    backfill_conversation_ids(conn)
+
+# Set conversation_id on direct messages that predate the column, in batches
+def backfill_conversation_ids(conn: Connection, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    # Same key as direct_conversation_id(): "dm:" + both user ids in sorted order
+    conversation_id = case(
+        (
+            Message.sender_id < Message.receiver_id,
+            literal("dm:") + Message.sender_id + literal(":") + Message.receiver_id
+        ),
+        else_=literal("dm:") + Message.receiver_id + literal(":") + Message.sender_id
+    )
+    pending = (
+        select(Message.id)
+        .filter(Message.receiver_id.isnot(None), Message.conversation_id.is_(None))
+        .limit(batch_size)
+    )
+
+    updated = 0
+    while True:
+        message_ids = list(conn.execute(pending).scalars())
+        if not message_ids:
+            return updated
+        conn.execute(
+            update(Message)
+            .filter(Message.id.in_(message_ids))
+            # Keep updated_at as it was; this is not a change to the message
+            .values(conversation_id=conversation_id, updated_at=Message.updated_at)
+        )
+        conn.commit()
+        updated += len(message_ids)
+        print(f"Backfilled conversation_id on {updated} messages")
+
+# Add the group_members indexes, groups.member_count (counted once when the
+# column is added) and groups.delivery_mode
+def upgrade_group_members(conn: Connection):
+    inspector = inspect(conn)
+    if "group_members" not in inspector.get_table_names():
+        return
+    for index in GroupMember.__table__.indexes:
+        index.create(bind=conn, checkfirst=True)
+
+    columns = {column["name"] for column in inspector.get_columns("groups")}
+    # GROUPS is a reserved word in MySQL 8
+    groups_table = conn.dialect.identifier_preparer.quote(Group.__tablename__)
+    if "member_count" not in columns:
+        conn.execute(text(f"ALTER TABLE {groups_table} ADD COLUMN member_count INTEGER NOT NULL DEFAULT 0"))
+        member_count = (
+            select(func.count())
+            .select_from(GroupMember)
+            .filter(GroupMember.group_id == Group.id)
+            .scalar_subquery()
+        )
+        conn.execute(update(Group).values(member_count=member_count, updated_at=Group.updated_at))
+        conn.commit()
+    if "delivery_mode" not in columns:
+        column_type = Group.__table__.c.delivery_mode.type.compile(dialect=conn.dialect)
+        conn.execute(text(
+            f"ALTER TABLE {groups_table} ADD COLUMN delivery_mode {column_type} "
+            f"NOT NULL DEFAULT '{GroupDeliveryMode.MEMBERS.name}'"
+        ))
+        conn.commit()
+
+# Columns that keyset cursors compare against bound datetimes
+KEYSET_TIMESTAMP_COLUMNS = [("messages", "created_at"), ("group_members", "joined_at")]
+
+# PRAGMA user_version of a SQLite database whose timestamps have been normalized
+SQLITE_TIMESTAMPS_NORMALIZED = 1
+
+# Rewrite SQLite timestamps written by the CURRENT_TIMESTAMP server default
+#
+# SQLite stores datetimes as text and compares them as strings. Rows written
+# by the server default look like '2024-01-01 10:00:03', while SQLAlchemy
+# binds '2024-01-01 10:00:03.000000', so a cursor taken from such a row sorts
+# after it: `before=` pages return the same row again and `after=` pages skip
+# the rest of that second. Appending the fractional part gives every row the
+# bound format. New rows get the Python-side default, so this only has to
+# happen once; the database's user_version records that it did. Other
+# databases store real datetimes and need nothing.
+def normalize_sqlite_timestamps(conn: Connection):
+    if conn.dialect.name != "sqlite":
+        return
+    if conn.exec_driver_sql("PRAGMA user_version").scalar() >= SQLITE_TIMESTAMPS_NORMALIZED:
+        return
+    tables = set(inspect(conn).get_table_names())
+    for table, column in KEYSET_TIMESTAMP_COLUMNS:
+        if table not in tables:
+            continue
+        result = conn.execute(text(
+            f"UPDATE {table} SET {column} = {column} || '.000000' WHERE length({column}) = 19"
+        ))
+        if result.rowcount:
+            print(f"Normalized {table}.{column} on {result.rowcount} rows")
+    conn.exec_driver_sql(f"PRAGMA user_version = {SQLITE_TIMESTAMPS_NORMALIZED}")
+    conn.commit()
+
+# Build the conversations read-model from existing messages
+#
+# Only runs while the table is still empty, i.e. once after upgrading.
+# Messages from before read watermarks existed count as unread unless their
+# status says READ.
+def backfill_conversations(conn: Connection):
+    if conn.scalar(select(Conversation.user_id).limit(1)) is not None:
+        return
+    if conn.scalar(select(Message.id).limit(1)) is None:
+        return
+
+    def latest_message(condition):
+        return conn.execute(
+            select(Message.id, Message.sender_id, Message.content, Message.created_at)
+            .filter(condition)
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(1)
+        ).first()
+
+    def unread_count(condition, user_id, conversation_id, direct):
+        read_up_to = conn.scalar(
+            select(ReadWatermark.read_up_to).filter(
+                ReadWatermark.user_id == user_id,
+                ReadWatermark.conversation_id == conversation_id
+            )
+        )
+        query = select(func.count()).select_from(Message).filter(condition, Message.sender_id != user_id)
+        if read_up_to is not None:
+            query = query.filter(Message.created_at > read_up_to)
+        if direct:
+            query = query.filter(Message.status != MessageStatus.READ)
+        return conn.scalar(query)
+
+    rows = []
+    conversation_ids = conn.execute(
+        select(Message.conversation_id).filter(Message.conversation_id.isnot(None)).distinct()
+    )
+    for conversation_id in conversation_ids.scalars().all():
+        condition = Message.conversation_id == conversation_id
+        last = latest_message(condition)
+        user_ids = conversation_id.split(":")[1:]
+        for user_id in dict.fromkeys(user_ids):
+            rows.append({
+                "user_id": user_id,
+                "conversation_id": conversation_id,
+                "peer_id": user_ids[1] if user_id == user_ids[0] else user_ids[0],
+                "group_id": None,
+                "unread_count": unread_count(condition, user_id, conversation_id, True),
+                "last_message_id": last.id,
+                "last_sender_id": last.sender_id,
+                "last_message_preview": last.content[:PREVIEW_LENGTH],
+                "last_message_at": last.created_at
+            })
+
+    # Channel groups have no per-member inbox rows
+    group_ids = conn.execute(
+        select(Message.group_id)
+        .join(Group, Group.id == Message.group_id)
+        .filter(Group.delivery_mode != GroupDeliveryMode.CHANNEL)
+        .distinct()
+    )
+    for group_id in group_ids.scalars().all():
+        condition = Message.group_id == group_id
+        conversation_id = group_conversation_id(group_id)
+        last = latest_message(condition)
+        member_ids = conn.execute(select(GroupMember.user_id).filter(GroupMember.group_id == group_id))
+        for user_id in member_ids.scalars().all():
+            rows.append({
+                "user_id": user_id,
+                "conversation_id": conversation_id,
+                "peer_id": None,
+                "group_id": group_id,
+                "unread_count": unread_count(condition, user_id, conversation_id, False),
+                "last_message_id": last.id,
+                "last_sender_id": last.sender_id,
+                "last_message_preview": last.content[:PREVIEW_LENGTH],
+                "last_message_at": last.created_at
+            })
+
+    for start in range(0, len(rows), BACKFILL_BATCH_SIZE):
+        conn.execute(insert(Conversation), rows[start:start + BACKFILL_BATCH_SIZE])
+    conn.commit()
+    print(f"Built {len(rows)} conversation rows")
+
+# Apply every upgrade (called from create_tables through run_sync)
+def run_migrations(conn: Connection):
+    normalize_sqlite_timestamps(conn)
+    upgrade_messages(conn)
+    upgrade_group_members(conn)
+    backfill_conversations(conn)
+    create_search_index(conn)
+
+if __name__ == "__main__":
+    from app.database import engine
+    with engine.connect() as conn:
+        run_migrations(conn)
+        conn.commit()
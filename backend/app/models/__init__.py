@@ -1,6 +1,13 @@
 from app.models.user import User
-from app.models.message import Message, MessageStatus, MessageType
-from app.models.group import Group, GroupMember
+from app.models.message import (
+    Message, MessageStatus, MessageType,
+    direct_conversation_id, group_conversation_id
+)
+from app.models.group import Group, GroupMember, GroupDeliveryMode
+from app.models.read_watermark import ReadWatermark
+from app.models.conversation import Conversation
+from app.models.archive_segment import ArchiveSegment
+from app.models.ids import new_message_id
 
 __all__ = [
     "User", 
@@ -8,5 +15,12 @@ __all__ = [
     "MessageStatus", 
     "MessageType", 
     "Group", 
-    "GroupMember"
+    "GroupMember",
+    "GroupDeliveryMode",
+    "ReadWatermark",
+    "Conversation",
+    "ArchiveSegment",
+    "direct_conversation_id",
+    "group_conversation_id",
+    "new_message_id"
 ] 
\ No newline at end of file
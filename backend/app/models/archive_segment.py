@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, String, DateTime, Index, func
+from app.database import Base
+
+# Index entry for one archive segment: up to ARCHIVE_SEGMENT_MESSAGES archived
+# messages of one conversation from one calendar month, stored as a gzip
+# NDJSON file under ARCHIVE_DIR. Only the last segment of a month is open:
+# archive runs fill it up (rewriting it under a new path) before they start
+# the next seq.
+class ArchiveSegment(Base):
+    __tablename__ = "archive_segments"
+    
+    conversation_id = Column(String(80), primary_key=True)
+    month = Column(String(7), primary_key=True)  # YYYY-MM
+    seq = Column(Integer, primary_key=True, default=0)  # counts up from 0 within a month
+    path = Column(String(255), nullable=False)  # relative to ARCHIVE_DIR
+    message_count = Column(Integer, nullable=False, default=0)
+    first_at = Column(DateTime(timezone=True), nullable=False)
+    last_at = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        Index("ix_archive_segments_conversation_last", "conversation_id", "last_at"),
+    )
+    
+    def __repr__(self):
+        return f"<ArchiveSegment {self.conversation_id} {self.month} {self.seq}>"
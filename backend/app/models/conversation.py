@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, func
+from app.database import Base
+
+# One row per user per conversation, kept up to date as messages are written
+# and read, so the inbox is a single index range scan over (user_id, last_message_at).
+#
+# conversation_id is the same key used by read watermarks: direct_conversation_id()
+# for direct messages (peer_id set) or group_conversation_id() for groups (group_id set).
+class Conversation(Base):
+    __tablename__ = "conversations"
+    
+    user_id = Column(String(36), ForeignKey("users.id"), primary_key=True)
+    conversation_id = Column(String(80), primary_key=True)
+    peer_id = Column(String(36), ForeignKey("users.id"), nullable=True)
+    group_id = Column(String(36), ForeignKey("groups.id"), nullable=True)
+    last_message_id = Column(String(36), nullable=True)
+    last_sender_id = Column(String(36), nullable=True)
+    last_message_preview = Column(String(255), nullable=True)
+    last_message_at = Column(DateTime(timezone=True), nullable=True)
+    unread_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        Index("ix_conversations_user_activity", "user_id", "last_message_at"),
+    )
+    
+    def __repr__(self):
+        return f"<Conversation {self.conversation_id} for {self.user_id}>"
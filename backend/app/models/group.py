@@ -1,7 +1,19 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, func
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Enum, Index, func
 from sqlalchemy.orm import relationship
 from app.database import Base
+from datetime import datetime
 import uuid
+import enum
+
+# How new group messages reach members
+#
+# MEMBERS pushes every message to every member and keeps their inbox rows and
+# resync indexes up to date. CHANNEL (broadcast-style groups) stores each
+# message once and only pushes it to sessions currently subscribed to the
+# group's room; other members read the history when they open the group.
+class GroupDeliveryMode(enum.Enum):
+    MEMBERS = "members"
+    CHANNEL = "channel"
 
 class Group(Base):
     __tablename__ = "groups"
@@ -13,6 +25,12 @@ class Group(Base):
     created_by = Column(String(36), ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Kept up to date by the member endpoints, so reads never count members
+    member_count = Column(Integer, nullable=False, default=0, server_default="0")
+    delivery_mode = Column(
+        Enum(GroupDeliveryMode), nullable=False,
+        default=GroupDeliveryMode.MEMBERS, server_default=GroupDeliveryMode.MEMBERS.name
+    )
     
     # Relationships
     members = relationship("GroupMember", back_populates="group")
@@ -28,11 +46,19 @@ class GroupMember(Base):
     group_id = Column(String(36), ForeignKey("groups.id"), nullable=False)
     user_id = Column(String(36), ForeignKey("users.id"), nullable=False)
     is_admin = Column(Boolean, default=False)
-    joined_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Set in Python for the same reason as Message.created_at (keyset cursors)
+    joined_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
     
     # Relationships
     group = relationship("Group", back_populates="members")
     user = relationship("User", back_populates="group_memberships")
     
+    __table_args__ = (
+        # A user's groups (group listing) without scanning every membership
+        Index("ix_group_members_user", "user_id", "group_id"),
+        # Member pages in join order
+        Index("ix_group_members_group_joined", "group_id", "joined_at", "id"),
+    )
+    
     def __repr__(self):
         return f"<GroupMember {self.user_id} in {self.group_id}>" 
\ No newline at end of file
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Enum, func
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Enum, Index, func
 from sqlalchemy.orm import relationship
 from app.database import Base
-import uuid
+from app.models.ids import new_message_id
+from datetime import datetime
 import enum
 
 class MessageStatus(enum.Enum):
@@ -16,19 +17,32 @@ class MessageType(enum.Enum):
     VIDEO = "video"
     FILE = "file"
 
+# Key shared by both participants of a direct conversation
+def direct_conversation_id(user_id: str, other_user_id: str) -> str:
+    return "dm:" + ":".join(sorted([user_id, other_user_id]))
+
+# Key of a group conversation
+def group_conversation_id(group_id: str) -> str:
+    return f"group:{group_id}"
+
 class Message(Base):
     __tablename__ = "messages"
     
-    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    # new_message_id() (26-character, time-ordered); older rows keep their uuid ids
+    id = Column(String(36), primary_key=True, default=new_message_id)
     sender_id = Column(String(36), ForeignKey("users.id"), nullable=False)
     receiver_id = Column(String(36), ForeignKey("users.id"), nullable=True)
     group_id = Column(String(36), ForeignKey("groups.id"), nullable=True)
+    # direct_conversation_id(sender_id, receiver_id) for direct messages, NULL for group messages
+    conversation_id = Column(String(80), nullable=True)
     content = Column(Text, nullable=False)
     message_type = Column(Enum(MessageType), default=MessageType.TEXT)
     file_url = Column(String(255), nullable=True)
     status = Column(Enum(MessageStatus), default=MessageStatus.SENT)
     is_deleted = Column(Boolean, default=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Set in Python so every row is stored in the same format as the keyset
+    # cursor bounds (SQLite's CURRENT_TIMESTAMP has no fractional seconds)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
@@ -36,5 +50,13 @@ class Message(Base):
     receiver = relationship("User", foreign_keys=[receiver_id], back_populates="received_messages")
     group = relationship("Group", back_populates="messages")
     
+    # History is read as a range scan of one conversation ordered by time
+    __table_args__ = (
+        Index("ix_messages_conversation_created", "conversation_id", "created_at"),
+        Index("ix_messages_group_created", "group_id", "created_at"),
+        # The archiver takes the oldest messages across all conversations in batches
+        Index("ix_messages_created_at_id", "created_at", "id"),
+    )
+    
     def __repr__(self):
         return f"<Message {self.id}>" 
\ No newline at end of file
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, String, DateTime, ForeignKey, func
+from app.database import Base
+
+# "Read up to" marker for one user in one conversation
+#
+# Every message in the conversation created at or before read_up_to counts
+# as read by the user, so a single row replaces per-message READ updates.
+class ReadWatermark(Base):
+    __tablename__ = "read_watermarks"
+    
+    user_id = Column(String(36), ForeignKey("users.id"), primary_key=True)
+    conversation_id = Column(String(80), primary_key=True)
+    read_up_to = Column(DateTime(timezone=True), nullable=False)
+    last_read_message_id = Column(String(36), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<ReadWatermark {self.user_id} in {self.conversation_id}>"
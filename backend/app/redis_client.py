@@ -1,4 +1,5 @@
 import redis
+import redis.asyncio as aioredis
 from app.config import settings
 import time
 import threading
@@ -6,6 +7,7 @@ import os
 
 # Initialize redis_client as None
 redis_client = None
+async_redis_client = None
 
 # In-memory store for OTPs when Redis is not available
 otp_store = {}
@@ -37,6 +39,20 @@ def get_redis_client():
             raise Exception(f"Failed to connect to Redis: {e}")
     return redis_client
 
+# Function to get or create async Redis connection (used for WebSocket pub/sub)
+def get_async_redis_client():
+    global async_redis_client
+    if async_redis_client is None:
+        async_redis_client = aioredis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB,
+            password=settings.REDIS_PASSWORD,
+            decode_responses=True,
+            socket_connect_timeout=5
+        )
+    return async_redis_client
+
 # Store OTP in Redis with expiry
 def store_otp(user_id: str, otp: str) -> bool:
     try:
@@ -70,43 +86,79 @@ def delete_otp(user_id: str) -> bool:
         print(f"Error deleting OTP: {e}")
         raise Exception(f"Failed to delete OTP: {e}")
 
-# Store user's online status
-def set_user_online(user_id: str) -> bool:
+# Presence is stored as one sorted set per user: its members are the ids of
+# the workers holding a session for the user, scored with the time (in ms)
+# their entry expires. WebSocket heartbeats keep pushing the expiry forward,
+# so a user whose worker crashes simply expires instead of staying online
+# forever, and a user stays online while any worker still has a live entry.
+# The set itself also expires once no worker refreshes it.
+def presence_key(user_id: str) -> str:
+    return f"presence:{user_id}"
+
+def presence_now_ms() -> int:
+    return int(time.time() * 1000)
+
+# Get online status for a batch of users (one ZCOUNT each, in one round trip)
+async def get_users_presence(user_ids: list) -> dict:
     try:
-        client = get_redis_client()
-        client.sadd("online_users", user_id)
-        return True
+        if not user_ids:
+            return {}
+        now = presence_now_ms()
+        pipe = get_async_redis_client().pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.zcount(presence_key(user_id), f"({now}", "+inf")
+        counts = await pipe.execute()
+        return {user_id: count > 0 for user_id, count in zip(user_ids, counts)}
     except Exception as e:
-        print(f"Error setting user online: {e}")
-        raise Exception(f"Failed to set user online: {e}")
+        print(f"Error getting users presence: {e}")
+        raise Exception(f"Failed to get users presence: {e}")
 
-# Remove user's online status
-def set_user_offline(user_id: str) -> bool:
+# Get all online users (scans every presence key; prefer get_users_presence)
+def get_online_users() -> list:
     try:
         client = get_redis_client()
-        client.srem("online_users", user_id)
-        return True
+        now = presence_now_ms()
+        user_ids = [key.split(":", 1)[1] for key in client.scan_iter(match=presence_key("*"), count=1000)]
+        pipe = client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.zcount(presence_key(user_id), f"({now}", "+inf")
+        return [user_id for user_id, count in zip(user_ids, pipe.execute()) if count > 0]
     except Exception as e:
-        print(f"Error setting user offline: {e}")
-        raise Exception(f"Failed to set user offline: {e}")
+        print(f"Error getting online users: {e}")
+        raise Exception(f"Failed to get online users: {e}")
 
-# Check if user is online
-def is_user_online(user_id: str) -> bool:
+# Refresh presence for users connected to this worker (called on connect and by heartbeats)
+#
+# Also drops entries of other workers that have expired.
+async def refresh_users_online(user_ids: list, node_id: str) -> bool:
     try:
-        client = get_redis_client()
-        return client.sismember("online_users", user_id)
+        if not user_ids:
+            return True
+        now = presence_now_ms()
+        ttl_ms = settings.PRESENCE_TTL_SECONDS * 1000
+        pipe = get_async_redis_client().pipeline(transaction=False)
+        for user_id in user_ids:
+            key = presence_key(user_id)
+            pipe.zadd(key, {node_id: now + ttl_ms})
+            pipe.zremrangebyscore(key, "-inf", now)
+            pipe.pexpire(key, ttl_ms)
+        await pipe.execute()
+        return True
     except Exception as e:
-        print(f"Error checking if user is online: {e}")
-        raise Exception(f"Failed to check if user is online: {e}")
+        print(f"Error refreshing user presence: {e}")
+        return False
 
-# Get all online users
-def get_online_users() -> list:
+# Clear this worker's presence entry when its last session for a user closes
+#
+# ZREM only touches this worker's member, so entries other workers refresh
+# concurrently are never removed; Redis deletes the set with its last member.
+async def clear_user_online(user_id: str, node_id: str) -> bool:
     try:
-        client = get_redis_client()
-        return client.smembers("online_users")
+        await get_async_redis_client().zrem(presence_key(user_id), node_id)
+        return True
     except Exception as e:
-        print(f"Error getting online users: {e}")
-        raise Exception(f"Failed to get online users: {e}")
+        print(f"Error clearing user presence: {e}")
+        return False
 
 # Clean up expired OTPs periodically (for in-memory store)
 def clean_expired_otps():
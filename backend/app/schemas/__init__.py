@@ -5,17 +5,20 @@ from app.schemas.auth import (
 )
 from app.schemas.user import (
     UserResponse, UserUpdate, 
-    UserProfileResponse, UserListResponse
+    UserProfileResponse, UserListResponse,
+    PresenceRequest, PresenceResponse
 )
 from app.schemas.message import (
     MessageBase, MessageCreate, MessageResponse, 
     MessageUpdate, MessageList, WebSocketMessage,
-    FileUploadResponse
+    FileUploadResponse, ConversationResponse, ConversationList,
+    SearchResult, SearchResponse
 )
 from app.schemas.group import (
     GroupBase, GroupCreate, GroupResponse, 
     GroupUpdate, GroupList, GroupMemberBase,
-    GroupMemberCreate, GroupMemberResponse
+    GroupMemberCreate, GroupMemberResponse, GroupMemberList,
+    GroupMembersBatch, GroupMemberBatchResult, GroupMembersBatchResponse
 )
 
 __all__ = [
@@ -27,14 +30,17 @@ __all__ = [
     # User schemas
     "UserResponse", "UserUpdate",
     "UserProfileResponse", "UserListResponse",
+    "PresenceRequest", "PresenceResponse",
     
     # Message schemas
     "MessageBase", "MessageCreate", "MessageResponse",
     "MessageUpdate", "MessageList", "WebSocketMessage",
-    "FileUploadResponse",
+    "FileUploadResponse", "ConversationResponse", "ConversationList",
+    "SearchResult", "SearchResponse",
     
     # Group schemas
     "GroupBase", "GroupCreate", "GroupResponse",
     "GroupUpdate", "GroupList", "GroupMemberBase",
-    "GroupMemberCreate", "GroupMemberResponse"
+    "GroupMemberCreate", "GroupMemberResponse", "GroupMemberList",
+    "GroupMembersBatch", "GroupMemberBatchResult", "GroupMembersBatchResponse"
 ] 
\ No newline at end of file
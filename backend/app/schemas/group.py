@@ -2,11 +2,14 @@ from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 from app.schemas.user import UserResponse
+from app.models.group import GroupDeliveryMode
 
 class GroupBase(BaseModel):
     name: str
     description: Optional[str] = None
     group_picture: Optional[str] = None
+    # "channel" for broadcast-style groups: live pushes only reach sessions subscribed to the group
+    delivery_mode: GroupDeliveryMode = GroupDeliveryMode.MEMBERS
 
 class GroupCreate(GroupBase):
     pass
@@ -31,6 +34,8 @@ class GroupResponse(GroupBase):
     id: str
     created_by: str
     created_at: datetime
+    member_count: int = 0
+    # Only filled with include_members=true; page through GET /chat/groups/{id}/members instead
     members: Optional[List[GroupMemberResponse]] = None
     
     class Config:
@@ -40,7 +45,29 @@ class GroupUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
     group_picture: Optional[str] = None
+    delivery_mode: Optional[GroupDeliveryMode] = None
 
 class GroupList(BaseModel):
     groups: list[GroupResponse]
-    total: int 
\ No newline at end of file
+    # Only counted when requested with include_total=true
+    total: Optional[int] = None
+
+class GroupMemberList(BaseModel):
+    members: list[GroupMemberResponse]
+    # Opaque cursor for the next page (None on the last page)
+    next_cursor: Optional[str] = None
+
+class GroupMembersBatch(BaseModel):
+    add: List[GroupMemberCreate] = Field(default_factory=list, max_length=5000)
+    # User IDs to remove
+    remove: List[str] = Field(default_factory=list, max_length=5000)
+
+class GroupMemberBatchResult(BaseModel):
+    user_id: str
+    action: str  # add or remove
+    # added, removed, already_member, not_member, user_not_found, duplicate, last_admin
+    status: str
+
+class GroupMembersBatchResponse(BaseModel):
+    results: list[GroupMemberBatchResult]
+    member_count: int
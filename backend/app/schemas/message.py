@@ -35,7 +35,40 @@ class MessageUpdate(BaseModel):
 
 class MessageList(BaseModel):
     messages: list[MessageResponse]
-    total: int
+    # Only counted when requested with include_total=true
+    total: Optional[int] = None
+    # Opaque cursor for the next page (None on the last page)
+    next_cursor: Optional[str] = None
+    # Caller's read watermark in this conversation
+    read_up_to: Optional[datetime] = None
+
+class ConversationResponse(BaseModel):
+    conversation_id: str
+    peer_id: Optional[str] = None
+    group_id: Optional[str] = None
+    last_message_id: Optional[str] = None
+    last_sender_id: Optional[str] = None
+    last_message_preview: Optional[str] = None
+    last_message_at: Optional[datetime] = None
+    unread_count: int
+    
+    class Config:
+        from_attributes = True
+
+class ConversationList(BaseModel):
+    conversations: list[ConversationResponse]
+    # Opaque cursor for the next (older) page, None on the last page
+    next_cursor: Optional[str] = None
+
+class SearchResult(BaseModel):
+    message: MessageResponse
+    # Plain text around the match (user content, not HTML: escape it before rendering)
+    snippet: str
+    # Lower is better
+    rank: float
+
+class SearchResponse(BaseModel):
+    results: list[SearchResult]
 
 class WebSocketMessage(BaseModel):
     type: str  # message, typing, read_receipt, etc.
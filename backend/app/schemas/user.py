@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
+from typing import Optional, Dict, List
 from datetime import datetime
 
 class UserResponse(BaseModel):
@@ -24,4 +24,11 @@ class UserProfileResponse(UserResponse):
 
 class UserListResponse(BaseModel):
     users: list[UserResponse]
-    total: int 
\ No newline at end of file
+    # Only counted when requested with include_total=true
+    total: Optional[int] = None
+
+class PresenceRequest(BaseModel):
+    user_ids: List[str] = Field(..., max_length=500)
+
+class PresenceResponse(BaseModel):
+    presence: Dict[str, bool]
@@ -0,0 +1,46 @@
+from fastapi.responses import JSONResponse
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Iterable, List
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the standard library encoder is used without it
+    orjson = None
+
+# Fast path for large list responses
+#
+# Endpoints returning many rows (history pages, user and group lists) select
+# just the columns their response model shows, turn each row into a plain
+# dict and encode the page in one call, instead of validating every ORM
+# object through a Pydantic model and then encoding the result. The
+# response_model stays on the route for the OpenAPI schema; returning a
+# Response skips its validation.
+
+def _default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+# Encode to JSON bytes (datetimes as ISO 8601, enums as their values, like the response models)
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+# Field names of a response model, in declaration order
+def model_fields(model) -> List[str]:
+    return list(model.model_fields)
+
+# Plain dict of the given fields of a row, ORM object or anything with attributes
+def row_to_dict(row: Any, fields: Iterable[str]) -> dict:
+    return {field: getattr(row, field) for field in fields}
@@ -6,6 +6,7 @@ from email.mime.multipart import MIMEMultipart
 from app.celery_worker import get_celery_app
 from app.config import settings
 from app.redis_client import store_otp
+from app.chat.archive import run_archive
 from twilio.rest import Client
 
 # Get Celery app instance
@@ -120,4 +121,21 @@ if celery_app:
 else:
     # Fallback function when Celery is not available
     def send_sms_otp(phone_number: str, user_id: str):
-        return send_sms_otp_task(phone_number, user_id)
\ No newline at end of file
+        return send_sms_otp_task(phone_number, user_id)
+
+# Move messages older than ARCHIVE_AFTER_DAYS to the cold archive
+def archive_messages_task():
+    try:
+        archived = run_archive()
+        return {"status": "success", "archived": archived}
+    except Exception as e:
+        print(f"Error in archive_messages_task: {e}")
+        return {"status": "error", "message": str(e)}
+
+# Wrap the task with celery if available (scheduled hourly by celery beat)
+if celery_app:
+    archive_messages = celery_app.task(name="archive_messages")(archive_messages_task)
+else:
+    # Fallback function when Celery is not available
+    def archive_messages():
+        return archive_messages_task()
\ No newline at end of file
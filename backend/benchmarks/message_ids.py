@@ -0,0 +1,78 @@
+from sqlalchemy import create_engine, insert, text
+from app.database import Base
+from app.models import Message, MessageStatus, MessageType, new_message_id
+from datetime import datetime, timedelta
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+# Compare random uuid4 message ids with time-ordered ids
+#
+# Usage: python -m benchmarks.message_ids [rows] [batch_size]
+#
+# Inserts the same messages into two fresh SQLite files, in batches as the
+# write-behind writer does, and reports the insert time and the on-disk size
+# of the messages table and its indexes.
+
+def make_rows(count: int, make_id, start: datetime):
+    return [
+        {
+            "id": make_id(),
+            "sender_id": "sender",
+            "receiver_id": "receiver",
+            "conversation_id": "dm:receiver:sender",
+            "content": f"message number {i}",
+            "message_type": MessageType.TEXT,
+            "status": MessageStatus.SENT,
+            "is_deleted": False,
+            "created_at": start + timedelta(milliseconds=i)
+        }
+        for i in range(count)
+    ]
+
+# Bytes used by each b-tree of the messages table (needs SQLite's dbstat table)
+def index_sizes(conn) -> dict:
+    try:
+        rows = conn.execute(text(
+            "SELECT name, SUM(pgsize) FROM dbstat WHERE name LIKE '%messages%' GROUP BY name"
+        ))
+        return {name: size for name, size in rows}
+    except Exception:
+        return {}
+
+def run(label: str, make_id, rows: int, batch_size: int):
+    path = os.path.join(tempfile.mkdtemp(), f"{label}.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine, tables=[Message.__table__])
+    start = datetime(2024, 1, 1)
+
+    elapsed = 0.0
+    for offset in range(0, rows, batch_size):
+        batch = make_rows(min(batch_size, rows - offset), make_id, start + timedelta(milliseconds=offset))
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            conn.execute(insert(Message), batch)
+        elapsed += time.perf_counter() - started
+
+    with engine.connect() as conn:
+        sizes = index_sizes(conn)
+    engine.dispose()
+    file_size = os.path.getsize(path)
+    os.remove(path)
+    return elapsed, file_size, sizes
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    print(f"{rows} messages in batches of {batch_size}")
+    results = {}
+    for label, make_id in (("uuid4", lambda: str(uuid.uuid4())), ("ordered", new_message_id)):
+        elapsed, file_size, sizes = run(label, make_id, rows, batch_size)
+        results[label] = (elapsed, file_size)
+        print(f"{label:>8}: {rows / elapsed:10.0f} rows/s  file {file_size / 1e6:7.1f} MB")
+        for name, size in sorted(sizes.items()):
+            print(f"{'':>10}{name:<40}{size / 1e6:7.1f} MB")
+    (uuid_time, uuid_size), (ordered_time, ordered_size) = results["uuid4"], results["ordered"]
+    print(f"ordered ids: {uuid_time / ordered_time:.2f}x insert throughput, {ordered_size / uuid_size:.0%} of the file size")
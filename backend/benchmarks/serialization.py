@@ -0,0 +1,109 @@
+from sqlalchemy import create_engine, select, insert
+from sqlalchemy.orm import Session
+from fastapi.responses import JSONResponse
+from app.database import Base
+from app.models import Message, MessageStatus, MessageType, User
+from app.schemas import MessageList, UserListResponse
+from app.chat.pagination import PAGE_COLUMNS
+from app.serialization import FastJSONResponse, model_fields, row_to_dict, orjson
+from app.schemas import MessageResponse, UserResponse
+from datetime import datetime, timedelta
+import json
+import sys
+import time
+import uuid
+
+# Compare the response_model path with the fast serialization path
+#
+# Usage: python -m benchmarks.serialization [rows] [repeats]
+#
+# Uses an in-memory SQLite database, so the numbers cover loading the rows
+# and encoding the response, not network or disk.
+
+def setup(engine, rows: int):
+    Base.metadata.create_all(engine)
+    start = datetime(2024, 1, 1)
+    users = [
+        {
+            "id": str(uuid.uuid4()),
+            "email": f"user{i}@example.com",
+            "full_name": f"User {i}",
+            "hashed_password": "x",
+            "is_active": True,
+            "is_verified": True,
+            "created_at": start
+        }
+        for i in range(rows)
+    ]
+    messages = [
+        {
+            "id": str(uuid.uuid4()),
+            "sender_id": users[i % 2]["id"],
+            "receiver_id": users[1 - i % 2]["id"],
+            "conversation_id": "dm:bench",
+            "content": f"message number {i} with some ordinary text in it",
+            "message_type": MessageType.TEXT,
+            "status": MessageStatus.DELIVERED,
+            "is_deleted": False,
+            "created_at": start + timedelta(seconds=i)
+        }
+        for i in range(rows)
+    ]
+    with engine.begin() as conn:
+        conn.execute(insert(User), users)
+        conn.execute(insert(Message), messages)
+
+def response_model_messages(db: Session) -> bytes:
+    messages = db.execute(select(Message).filter(Message.conversation_id == "dm:bench")).scalars().all()
+    payload = MessageList.model_validate(
+        {"messages": [MessageResponse.model_validate(message) for message in messages], "total": None}
+    )
+    return JSONResponse(payload.model_dump(mode="json")).body
+
+def fast_messages(db: Session) -> bytes:
+    fields = model_fields(MessageResponse)
+    rows = db.execute(select(*PAGE_COLUMNS).filter(Message.conversation_id == "dm:bench"))
+    return FastJSONResponse({
+        "messages": [row_to_dict(row, fields) for row in rows],
+        "total": None,
+        "next_cursor": None,
+        "read_up_to": None
+    }).body
+
+def response_model_users(db: Session) -> bytes:
+    users = db.execute(select(User)).scalars().all()
+    payload = UserListResponse.model_validate({"users": users, "total": None}, from_attributes=True)
+    return JSONResponse(payload.model_dump(mode="json")).body
+
+def fast_users(db: Session) -> bytes:
+    fields = model_fields(UserResponse)
+    rows = db.execute(select(*[getattr(User, field) for field in fields]))
+    return FastJSONResponse({"users": [row_to_dict(row, fields) for row in rows], "total": None}).body
+
+def timed(engine, function, repeats: int):
+    best = None
+    for _ in range(repeats):
+        with Session(engine) as db:
+            started = time.perf_counter()
+            body = function(db)
+            elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, body
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    engine = create_engine("sqlite://")
+    setup(engine, rows)
+    print(f"{rows} rows, best of {repeats}, encoder: {'orjson' if orjson else 'json'}")
+    for name, slow, fast in (
+        ("messages", response_model_messages, fast_messages),
+        ("users", response_model_users, fast_users)
+    ):
+        slow_time, slow_body = timed(engine, slow, repeats)
+        fast_time, fast_body = timed(engine, fast, repeats)
+        assert json.loads(slow_body) == json.loads(fast_body), f"{name}: responses differ"
+        print(
+            f"{name:>8}: response_model {slow_time * 1000:8.1f} ms  "
+            f"fast path {fast_time * 1000:8.1f} ms  ({slow_time / fast_time:.1f}x)"
+        )
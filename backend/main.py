@@ -1,5 +1,9 @@
 from app.main import app
+from app.config import settings
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    uvicorn.run(
+        "app.main:app", host="0.0.0.0", port=8000, reload=True,
+        ws_per_message_deflate=settings.WEBSOCKET_PER_MESSAGE_DEFLATE
+    ) 
\ No newline at end of file
@@ -0,0 +1,66 @@
+import os
+import tempfile
+
+# Settings are read when app.config is imported, so point them at a scratch
+# database before any app module is loaded
+TEST_DIR = tempfile.mkdtemp(prefix="chatapp-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{TEST_DIR}/test.db"
+os.environ["ARCHIVE_DIR"] = os.path.join(TEST_DIR, "archive")
+os.environ["WEBSOCKET_BROKER"] = "memory"
+os.environ["MESSAGE_WRITE_BEHIND"] = "false"
+
+import asyncio
+import httpx
+import pytest
+from app.auth.security import create_access_token
+from app.database import Base, engine, async_engine
+from app.models import User
+
+# Fresh schema for every test
+@pytest.fixture
+def database():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    # Outside the metadata: the FTS5 index (dropped so its triggers are
+    # created again) and the user_version of a new database file
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP TABLE IF EXISTS messages_fts")
+        conn.exec_driver_sql("PRAGMA user_version = 0")
+    yield engine
+    engine.dispose()
+
+# Run a coroutine to completion on a new event loop
+#
+# Pooled async connections belong to the loop that opened them, so the pool
+# is emptied before the loop closes.
+@pytest.fixture
+def run():
+    def run(coro):
+        async def main():
+            try:
+                return await coro
+            finally:
+                await async_engine.dispose()
+        return asyncio.run(main())
+    return run
+
+# Insert a user and return (user_id, Authorization headers)
+@pytest.fixture
+def make_user(database):
+    def make_user(email: str):
+        with database.begin() as conn:
+            user_id = conn.execute(
+                User.__table__.insert().values(id=email, email=email, hashed_password="x")
+            ).inserted_primary_key[0]
+        token = create_access_token({"sub": user_id})
+        return user_id, {"Authorization": f"Bearer {token}"}
+    return make_user
+
+# HTTP client for the app (startup events are not run)
+def api_client() -> httpx.AsyncClient:
+    from app.main import app
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+@pytest.fixture
+def client():
+    return api_client
@@ -0,0 +1,119 @@
+import json
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from app.chat.archive import archive_messages, segment_cache
+from app.chat.conversations import conversation_filter
+from app.chat.export import import_messages
+from app.chat.pagination import fetch_message_page
+from app.config import settings
+from app.database import AsyncSessionLocal, SessionLocal
+from app.models import ArchiveSegment, Message, MessageStatus, MessageType, direct_conversation_id
+
+START = datetime(2024, 1, 31, 12, 0, 0)
+
+def message_rows(sender_id: str, receiver_id: str, count: int):
+    return [
+        {
+            "id": f"m{number:03d}", "sender_id": sender_id, "receiver_id": receiver_id,
+            "conversation_id": direct_conversation_id(sender_id, receiver_id),
+            "content": f"message {number}", "message_type": MessageType.TEXT,
+            "status": MessageStatus.SENT, "created_at": START + timedelta(hours=number)
+        }
+        for number in range(count)
+    ]
+
+def test_history_pages_through_small_segments(database, make_user, run):
+    alice, _ = make_user("alice@example.com")
+    bob, _ = make_user("bob@example.com")
+    conversation_id = direct_conversation_id(alice, bob)
+    rows = message_rows(alice, bob, 30)
+    with database.begin() as conn:
+        conn.execute(Message.__table__.insert(), rows)
+
+    # Spans two months; 20 messages archived in batches of 7, segments of at most 4
+    with SessionLocal() as db:
+        assert archive_messages(db, START + timedelta(hours=20), batch_size=7, segment_messages=4) == 20
+        segments = db.execute(select(ArchiveSegment).order_by(ArchiveSegment.first_at)).scalars().all()
+    assert all(segment.message_count <= 4 for segment in segments)
+    assert sum(segment.message_count for segment in segments) == 20
+    assert {segment.month for segment in segments} == {"2024-01", "2024-02"}
+    assert not any(name.endswith(".tmp") for _, _, names in os.walk(settings.ARCHIVE_DIR) for name in names)
+
+    async def read_backwards():
+        segment_cache.clear()
+        seen, cursor = [], None
+        async with AsyncSessionLocal() as db:
+            messages, cursor = await fetch_message_page(
+                db, conversation_filter(conversation_id), 12, conversation_id=conversation_id
+            )
+            seen.extend(message.id for message in messages)
+            # The first page only reaches three messages into the archive
+            decoded = len(segment_cache)
+            while cursor is not None:
+                messages, cursor = await fetch_message_page(
+                    db, conversation_filter(conversation_id), 5, before=cursor, conversation_id=conversation_id
+                )
+                seen.extend(message.id for message in messages)
+        return seen, decoded
+
+    seen, decoded = run(read_backwards())
+    assert seen == [row["id"] for row in reversed(rows)]
+    assert decoded < len(segments)
+
+def test_interleaved_conversations_fill_their_segments(database, make_user):
+    users = [make_user(f"user{number}@example.com")[0] for number in range(9)]
+    # Eight conversations with 11 messages each, interleaved in time, all in January
+    rows = [
+        {
+            "id": f"m{number:03d}", "sender_id": users[0], "receiver_id": users[1 + number % 8],
+            "conversation_id": direct_conversation_id(users[0], users[1 + number % 8]),
+            "content": f"message {number}", "message_type": MessageType.TEXT,
+            "status": MessageStatus.SENT, "created_at": datetime(2024, 1, 1) + timedelta(minutes=number)
+        }
+        for number in range(88)
+    ]
+    with database.begin() as conn:
+        conn.execute(Message.__table__.insert(), rows)
+
+    # Two runs, each in batches holding one or two messages per conversation
+    with SessionLocal() as db:
+        assert archive_messages(db, rows[40]["created_at"], batch_size=12, segment_messages=5) == 40
+        assert archive_messages(db, rows[-1]["created_at"] + timedelta(minutes=1), batch_size=12, segment_messages=5) == 48
+        segments = db.execute(
+            select(ArchiveSegment).order_by(ArchiveSegment.conversation_id, ArchiveSegment.seq)
+        ).scalars().all()
+
+    # 11 messages per conversation fill two segments of 5 and leave one open
+    assert len(segments) == 8 * 3
+    assert [(segment.seq, segment.message_count) for segment in segments[:3]] == [(0, 5), (1, 5), (2, 1)]
+    # Filled segments were rewritten under new paths and the old files removed
+    directories = {os.path.dirname(segment.path) for segment in segments}
+    files = {
+        os.path.join(directory, name)
+        for directory in directories
+        for name in os.listdir(os.path.join(settings.ARCHIVE_DIR, directory))
+    }
+    assert files == {segment.path for segment in segments}
+
+def test_import_skips_messages_not_newer_than_the_archive(database, make_user, run):
+    alice, _ = make_user("alice@example.com")
+    bob, _ = make_user("bob@example.com")
+    rows = message_rows(alice, bob, 4)
+    with database.begin() as conn:
+        conn.execute(Message.__table__.insert(), rows[:2])
+    with SessionLocal() as db:
+        assert archive_messages(db, START + timedelta(days=1)) == 2
+
+    # One line older than the archived messages, one as old as the newest, one newer
+    lines = [
+        json.dumps({**record, "created_at": created_at.isoformat()})
+        for record, created_at in [
+            ({"id": "old", "sender_id": alice, "receiver_id": bob, "content": "old"}, START - timedelta(hours=1)),
+            ({"id": "tie", "sender_id": alice, "receiver_id": bob, "content": "tie"}, rows[1]["created_at"]),
+            ({"id": "new", "sender_id": alice, "receiver_id": bob, "content": "new"}, rows[2]["created_at"]),
+        ]
+    ]
+    assert run(import_messages(lines, mark_read=False)) == 1
+    with database.connect() as conn:
+        assert list(conn.execute(select(Message.id)).scalars()) == ["new"]
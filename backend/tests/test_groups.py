@@ -0,0 +1,135 @@
+from contextlib import contextmanager
+from sqlalchemy import event, select, text
+from app.database import async_engine
+from app.migrations import run_migrations
+from app.models import Group, GroupDeliveryMode, GroupMember
+
+# Count the statements sent to the database while the block runs
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+# n groups of the given user, each with the other users as members
+def make_groups(database, user_id: str, n: int, other_ids: list):
+    with database.begin() as conn:
+        for number in range(n):
+            group_id = f"{user_id}-group-{number}"
+            conn.execute(Group.__table__.insert().values(
+                id=group_id, name=f"Group {number}", created_by=user_id, member_count=1 + len(other_ids)
+            ))
+            conn.execute(GroupMember.__table__.insert(), [
+                {"id": f"{group_id}-{member_id}", "group_id": group_id, "user_id": member_id, "is_admin": member_id == user_id}
+                for member_id in [user_id] + other_ids
+            ])
+
+def list_groups(run, client, headers, **params):
+    async def request():
+        async with client() as http:
+            with count_queries() as statements:
+                response = await http.get("/chat/groups", params={"limit": 50, **params}, headers=headers)
+        assert response.status_code == 200
+        return response.json(), len(statements)
+    return run(request())
+
+def test_group_list_query_count_does_not_grow_with_groups(database, make_user, run, client):
+    other_ids = [make_user(f"other{number}@example.com")[0] for number in range(2)]
+    counts = {}
+    for n in (2, 10):
+        user_id, headers = make_user(f"owner{n}@example.com")
+        make_groups(database, user_id, n, other_ids)
+
+        for include_members in (False, True):
+            body, queries = list_groups(run, client, headers, include_members=include_members)
+            assert len(body["groups"]) == n
+            assert body["total"] is None
+            if include_members:
+                assert all(len(group["members"]) == 3 for group in body["groups"])
+                assert all(member["user"]["email"] for group in body["groups"] for member in group["members"])
+            counts[n, include_members] = queries
+
+    assert counts[2, False] == counts[10, False]
+    assert counts[2, True] == counts[10, True]
+    # Members and their users are two batched loads
+    assert counts[2, True] == counts[2, False] + 2
+
+def test_group_list_total_is_opt_in(database, make_user, run, client):
+    user_id, headers = make_user("owner@example.com")
+    make_groups(database, user_id, 3, [])
+
+    body, queries = list_groups(run, client, headers)
+    assert body["total"] is None
+    body, queries_with_total = list_groups(run, client, headers, include_total=True)
+    assert body["total"] == 3
+    assert queries_with_total == queries + 1
+
+def test_batch_reports_each_member_and_keeps_the_last_admin(database, make_user, run, client):
+    owner, headers = make_user("owner@example.com")
+    admin_ids = [make_user(f"admin{number}@example.com")[0] for number in range(2)]
+    member_id, _ = make_user("member@example.com")
+    new_id, _ = make_user("new@example.com")
+    with database.begin() as conn:
+        conn.execute(Group.__table__.insert().values(id="g1", name="Group", created_by=owner, member_count=4))
+        conn.execute(GroupMember.__table__.insert(), [
+            {"id": f"g1-{user_id}", "group_id": "g1", "user_id": user_id, "is_admin": user_id != member_id}
+            for user_id in [owner] + admin_ids + [member_id]
+        ])
+
+    async def request():
+        async with client() as http:
+            return await http.post("/chat/groups/g1/members/batch", headers=headers, json={
+                "add": [
+                    {"user_id": new_id}, {"user_id": new_id},
+                    {"user_id": member_id}, {"user_id": "nobody@example.com"}
+                ],
+                # Every admin, the caller included
+                "remove": [admin_ids[0], owner, admin_ids[1], "stranger@example.com"]
+            })
+
+    response = run(request())
+    assert response.status_code == 200
+    body = response.json()
+    assert [(result["user_id"], result["action"], result["status"]) for result in body["results"]] == [
+        (new_id, "add", "added"),
+        (new_id, "add", "duplicate"),
+        (member_id, "add", "already_member"),
+        ("nobody@example.com", "add", "user_not_found"),
+        (admin_ids[0], "remove", "removed"),
+        (owner, "remove", "removed"),
+        (admin_ids[1], "remove", "last_admin"),
+        ("stranger@example.com", "remove", "not_member"),
+    ]
+    with database.connect() as conn:
+        members = dict(conn.execute(
+            select(GroupMember.user_id, GroupMember.is_admin).filter(GroupMember.group_id == "g1")
+        ).all())
+        stored_count = conn.scalar(select(Group.member_count).filter(Group.id == "g1"))
+    assert members == {admin_ids[1]: True, member_id: False, new_id: False}
+    assert body["member_count"] == stored_count == len(members)
+
+def test_upgrade_adds_group_columns(database, make_user):
+    user_id, _ = make_user("owner@example.com")
+    other_ids = [make_user(f"other{number}@example.com")[0] for number in range(2)]
+    # A groups table from before member_count and delivery_mode
+    with database.begin() as conn:
+        conn.execute(text("ALTER TABLE groups DROP COLUMN member_count"))
+        conn.execute(text("ALTER TABLE groups DROP COLUMN delivery_mode"))
+        conn.execute(text("INSERT INTO groups (id, name, created_by) VALUES ('g1', 'Group', :user_id)"), {"user_id": user_id})
+        conn.execute(GroupMember.__table__.insert(), [
+            {"id": f"g1-{member_id}", "group_id": "g1", "user_id": member_id, "is_admin": member_id == user_id}
+            for member_id in [user_id] + other_ids
+        ])
+    with database.connect() as conn:
+        run_migrations(conn)
+        conn.commit()
+    with database.connect() as conn:
+        row = conn.execute(select(Group.member_count, Group.delivery_mode).filter(Group.id == "g1")).one()
+    assert tuple(row) == (3, GroupDeliveryMode.MEMBERS)
@@ -0,0 +1,37 @@
+from sqlalchemy import select
+from app.database import SessionLocal
+from app.models import Message, new_message_id, ids
+from app.models.ids import ID_LENGTH, MonotonicIdGenerator, encode_id
+
+def test_ids_in_one_millisecond_are_strictly_increasing(monkeypatch):
+    generator = MonotonicIdGenerator()
+    clock = [1_700_000_000_000 * 1_000_000]
+    monkeypatch.setattr(ids.time, "time_ns", lambda: clock[0])
+    same_millisecond = [generator.new_id() for _ in range(1000)]
+    # The clock going back keeps counting up from the last id
+    clock[0] -= 5_000_000
+    went_back = [generator.new_id() for _ in range(10)]
+    generated = same_millisecond + went_back
+    assert all(a < b for a, b in zip(generated, generated[1:]))
+
+def test_ids_sort_like_created_at(database, make_user):
+    alice, _ = make_user("alice@example.com")
+    bob, _ = make_user("bob@example.com")
+    with SessionLocal() as db:
+        for number in range(300):
+            db.add(Message(sender_id=alice, receiver_id=bob, content=f"message {number}"))
+            if number % 50 == 0:
+                db.flush()
+        db.commit()
+        created_at = db.execute(select(Message.created_at).order_by(Message.id)).scalars().all()
+    assert len(created_at) == 300
+    assert created_at == sorted(created_at)
+
+def test_ids_fit_the_id_column():
+    column_length = Message.__table__.c.id.type.length
+    assert ID_LENGTH <= column_length
+    assert len(new_message_id()) == ID_LENGTH
+    # Smallest and largest 128-bit values keep the fixed length
+    assert len(encode_id(0)) == len(encode_id((1 << 128) - 1)) == ID_LENGTH
+    # Later timestamps always sort later as strings
+    assert encode_id(1 << 80) > encode_id((1 << 80) - 1)
@@ -0,0 +1,23 @@
+import asyncio
+from app.chat.manager import ClientConnection
+
+class StubWebSocket:
+    async def close(self, code: int = 1000):
+        pass
+
+def test_close_wakes_a_blocked_send():
+    async def main():
+        # The writer is never started, as after it was cancelled with the queue full
+        connection = ClientConnection(StubWebSocket(), "alice@example.com", queue_size=1)
+        await connection.send("first")
+        blocked = asyncio.create_task(connection.send("second"))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+
+        await connection.close()
+        await asyncio.wait_for(blocked, 1)
+        assert connection.queue.qsize() == 1
+        # Later sends return straight away
+        await asyncio.wait_for(connection.send("third"), 1)
+
+    asyncio.run(main())
@@ -0,0 +1,129 @@
+from sqlalchemy import text
+from app.chat.conversations import conversation_filter
+from app.chat.pagination import fetch_message_page, encode_page_cursor
+from app.database import AsyncSessionLocal
+from app.migrations import run_migrations
+from app.models import direct_conversation_id
+
+# Timestamps as the old CURRENT_TIMESTAMP server default stored them: no
+# fractional seconds, and several rows in the same second
+LEGACY_TIMES = [
+    "2024-01-01 10:00:01",
+    "2024-01-01 10:00:02",
+    "2024-01-01 10:00:03",
+    "2024-01-01 10:00:03",
+    "2024-01-01 10:00:03",
+    "2024-01-01 10:00:04",
+    "2024-01-01 10:00:04",
+]
+LEGACY_IDS = [f"legacy-{number:02d}" for number in range(len(LEGACY_TIMES))]
+
+def migrate(database):
+    with database.connect() as conn:
+        run_migrations(conn)
+        conn.commit()
+
+def insert_legacy_messages(database, sender_id: str, receiver_id: str) -> str:
+    conversation_id = direct_conversation_id(sender_id, receiver_id)
+    with database.begin() as conn:
+        for message_id, created_at in zip(LEGACY_IDS, LEGACY_TIMES):
+            conn.execute(
+                text(
+                    "INSERT INTO messages (id, sender_id, receiver_id, conversation_id, content, "
+                    "message_type, status, is_deleted, created_at) "
+                    "VALUES (:id, :sender_id, :receiver_id, :conversation_id, 'hi', 'TEXT', 'SENT', 0, :created_at)"
+                ),
+                {
+                    "id": message_id, "sender_id": sender_id, "receiver_id": receiver_id,
+                    "conversation_id": conversation_id, "created_at": created_at
+                }
+            )
+    migrate(database)
+    return conversation_id
+
+def test_before_pages_through_legacy_rows(database, make_user, run):
+    alice, _ = make_user("alice@example.com")
+    bob, _ = make_user("bob@example.com")
+    conversation_id = insert_legacy_messages(database, alice, bob)
+
+    async def read_backwards():
+        seen, cursor = [], None
+        async with AsyncSessionLocal() as db:
+            for _ in LEGACY_IDS:
+                messages, cursor = await fetch_message_page(
+                    db, conversation_filter(conversation_id), 2, before=cursor
+                )
+                seen.extend(message.id for message in messages)
+                if cursor is None:
+                    break
+        return seen
+
+    assert run(read_backwards()) == list(reversed(LEGACY_IDS))
+
+def test_after_pages_through_legacy_rows(database, make_user, run):
+    alice, _ = make_user("alice@example.com")
+    bob, _ = make_user("bob@example.com")
+    conversation_id = insert_legacy_messages(database, alice, bob)
+
+    async def read_forwards():
+        async with AsyncSessionLocal() as db:
+            latest, _ = await fetch_message_page(db, conversation_filter(conversation_id), len(LEGACY_IDS))
+            oldest = latest[-1]
+            seen, cursor = [oldest.id], encode_page_cursor(oldest)
+            for _ in LEGACY_IDS:
+                messages, cursor = await fetch_message_page(
+                    db, conversation_filter(conversation_id), 2, after=cursor
+                )
+                # Pages are returned newest first
+                seen.extend(message.id for message in reversed(messages))
+                if cursor is None:
+                    break
+        return seen
+
+    assert run(read_forwards()) == LEGACY_IDS
+
+def test_member_pages_through_legacy_rows(database, make_user, run, client):
+    owner, headers = make_user("owner@example.com")
+    member_ids = [make_user(f"member{number}@example.com")[0] for number in range(5)]
+    with database.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO groups (id, name, created_by, member_count, delivery_mode) "
+            "VALUES ('g1', 'Group', :owner, 6, 'MEMBERS')"
+        ), {"owner": owner})
+        for number, user_id in enumerate([owner] + member_ids):
+            conn.execute(text(
+                "INSERT INTO group_members (id, group_id, user_id, is_admin, joined_at) "
+                "VALUES (:id, 'g1', :user_id, :is_admin, '2024-01-01 10:00:00')"
+            ), {"id": f"m{number}", "user_id": user_id, "is_admin": user_id == owner})
+    migrate(database)
+
+    async def read_members():
+        seen, cursor = [], None
+        async with client() as http:
+            for _ in range(6):
+                params = {"limit": 2, **({"after": cursor} if cursor else {})}
+                response = await http.get("/chat/groups/g1/members", params=params, headers=headers)
+                assert response.status_code == 200
+                page = response.json()
+                seen.extend(member["user_id"] for member in page["members"])
+                cursor = page["next_cursor"]
+                if cursor is None:
+                    break
+        return seen
+
+    assert run(read_members()) == [owner] + member_ids
+
+def test_timestamps_are_normalized_once(database, make_user):
+    alice, _ = make_user("alice@example.com")
+    bob, _ = make_user("bob@example.com")
+    insert_legacy_messages(database, alice, bob)
+    with database.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO messages (id, sender_id, receiver_id, content, message_type, status, is_deleted, created_at) "
+            "VALUES ('late', :alice, :bob, 'hi', 'TEXT', 'SENT', 0, '2024-01-01 10:00:05')"
+        ), {"alice": alice, "bob": bob})
+    # Later startups leave the table alone
+    migrate(database)
+    with database.connect() as conn:
+        lengths = dict(conn.execute(text("SELECT id, length(created_at) FROM messages")).all())
+    assert lengths == {**{message_id: 26 for message_id in LEGACY_IDS}, "late": 19}
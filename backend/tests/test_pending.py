@@ -0,0 +1,40 @@
+import json
+from app.chat import pending
+from app.chat.pending import iter_pending_batches, pending_key, pending_message_key
+
+# Just the sorted set and string reads the resync path makes, with Redis's
+# ordering: by score, then by member
+class FakeRedis:
+    def __init__(self):
+        self.sorted_sets = {}
+        self.strings = {}
+
+    async def zrangebyscore(self, key, minimum, maximum, start=0, num=None, withscores=False):
+        exclusive = isinstance(minimum, str) and minimum.startswith("(")
+        minimum = int(minimum[1:]) if exclusive else int(minimum)
+        entries = sorted(self.sorted_sets.get(key, {}).items(), key=lambda entry: (entry[1], entry[0]))
+        entries = [entry for entry in entries if entry[1] > minimum or (entry[1] == minimum and not exclusive)]
+        return entries[start:start + num]
+
+    async def mget(self, keys):
+        return [self.strings.get(key) for key in keys]
+
+def test_resync_keeps_messages_that_share_a_score_across_batches(run, monkeypatch):
+    redis = FakeRedis()
+    monkeypatch.setattr(pending, "get_async_redis_client", lambda: redis)
+    # Five messages; m2, m3 and m4 were created in the same microsecond
+    scores = {"m1": 100, "m2": 200, "m3": 200, "m4": 200, "m5": 300}
+    redis.sorted_sets[pending_key("alice")] = scores
+    for message_id in scores:
+        redis.strings[pending_message_key(message_id)] = json.dumps({"id": message_id})
+
+    async def replay(after: int):
+        batches = []
+        async for messages, cursor in iter_pending_batches("alice", after, 2):
+            batches.append(([message["id"] for message in messages], cursor))
+        return batches
+
+    # Batch boundaries fall between messages with the same score
+    assert run(replay(0)) == [(["m1", "m2"], 200), (["m3", "m4"], 200), (["m5"], 300)]
+    # The client's own cursor stays exclusive
+    assert run(replay(200)) == [(["m5"], 300)]
@@ -0,0 +1,76 @@
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+from app.chat import persistence
+from app.chat.persistence import MessageWriter
+from app.models import Message, MessageStatus, MessageType, direct_conversation_id
+
+def message_rows(alice: str, bob: str, count: int):
+    return [
+        {
+            "id": f"m{number:02d}", "sender_id": alice, "receiver_id": bob, "group_id": None,
+            "conversation_id": direct_conversation_id(alice, bob), "content": f"message {number}",
+            "message_type": MessageType.TEXT, "file_url": None,
+            "status": MessageStatus.SENT, "created_at": datetime.utcnow()
+        }
+        for number in range(count)
+    ]
+
+def test_bad_row_only_loses_itself(database, make_user, run):
+    alice, _ = make_user("alice@example.com")
+    bob, _ = make_user("bob@example.com")
+    rows = [
+        {
+            "id": f"m{number:02d}", "sender_id": alice, "receiver_id": bob, "group_id": None,
+            "conversation_id": direct_conversation_id(alice, bob),
+            # content is NOT NULL, so row 5 cannot be inserted
+            "content": None if number == 5 else f"message {number}",
+            "message_type": MessageType.TEXT, "file_url": None,
+            "status": MessageStatus.SENT, "created_at": datetime.utcnow()
+        }
+        for number in range(12)
+    ]
+
+    async def write():
+        writer = MessageWriter(batch_size=len(rows), flush_interval=0.01)
+        await writer._flush(rows)
+        return writer
+
+    writer = run(write())
+    assert (writer.written, writer.failed) == (11, 1)
+    with database.connect() as conn:
+        stored = set(conn.execute(select(Message.id)).scalars())
+    assert stored == {row["id"] for row in rows} - {"m05"}
+
+# A writer whose database is down for the first few attempts
+class FlakyWriter(MessageWriter):
+    def __init__(self, failures: int, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+        self.attempts = 0
+
+    async def _write_batch(self, batch):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise OperationalError("INSERT INTO messages", {}, Exception("database is locked"))
+        await super()._write_batch(batch)
+
+def test_outage_keeps_retrying_without_losing_rows(database, make_user, run, monkeypatch):
+    alice, _ = make_user("alice@example.com")
+    bob, _ = make_user("bob@example.com")
+    rows = message_rows(alice, bob, 12)
+    monkeypatch.setattr(persistence, "RETRY_BASE_DELAY", 0.001)
+
+    async def write():
+        # More failures than MAX_FLUSH_ATTEMPTS
+        writer = FlakyWriter(2 * persistence.MAX_FLUSH_ATTEMPTS, batch_size=len(rows), flush_interval=0.01)
+        await writer._flush(rows)
+        return writer
+
+    writer = run(write())
+    # The whole batch went in on the first attempt after the outage
+    assert (writer.written, writer.failed, writer.batches) == (12, 0, 1)
+    assert writer.attempts == 2 * persistence.MAX_FLUSH_ATTEMPTS + 1
+    with database.connect() as conn:
+        stored = set(conn.execute(select(Message.id)).scalars())
+    assert stored == {row["id"] for row in rows}
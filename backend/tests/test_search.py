@@ -0,0 +1,99 @@
+from datetime import datetime
+from sqlalchemy import text
+from app.chat.search import search_messages, vacuum_database
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.migrations import run_migrations
+from app.models import Conversation, Message, MessageStatus, ReadWatermark, direct_conversation_id
+
+def test_search_works_after_vacuum(database, make_user, run):
+    alice, _ = make_user("alice@example.com")
+    bob, _ = make_user("bob@example.com")
+    conversation_id = direct_conversation_id(alice, bob)
+    with database.connect() as conn:
+        run_migrations(conn)
+        conn.commit()
+    with database.begin() as conn:
+        conn.execute(Message.__table__.insert(), [
+            {
+                "id": f"m{number:03d}", "sender_id": alice, "receiver_id": bob,
+                "conversation_id": conversation_id, "content": f"filler {number}"
+            }
+            for number in range(200)
+        ] + [{
+            "id": "target", "sender_id": alice, "receiver_id": bob,
+            "conversation_id": conversation_id, "content": "the needle is here"
+        }])
+        conn.execute(Conversation.__table__.insert().values(
+            user_id=alice, conversation_id=conversation_id, peer_id=bob, unread_count=0
+        ))
+        # Leave gaps in the rowids for VACUUM to close
+        conn.execute(text("DELETE FROM messages WHERE id < 'm150'"))
+
+    with database.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        vacuum_database(conn)
+
+    async def search():
+        async with AsyncSessionLocal() as db:
+            return await search_messages(db, alice, "needle", 10)
+
+    assert [message.id for message, hit in run(search())] == ["target"]
+
+def test_snippets_are_plain_text_on_every_backend(database, make_user, run, monkeypatch):
+    alice, _ = make_user("alice@example.com")
+    bob, _ = make_user("bob@example.com")
+    conversation_id = direct_conversation_id(alice, bob)
+    content = "the <img src=x onerror=alert(1)> needle"
+    with database.connect() as conn:
+        run_migrations(conn)
+        conn.commit()
+    with database.begin() as conn:
+        conn.execute(Message.__table__.insert().values(
+            id="target", sender_id=alice, receiver_id=bob, conversation_id=conversation_id, content=content
+        ))
+        conn.execute(Conversation.__table__.insert().values(
+            user_id=alice, conversation_id=conversation_id, peer_id=bob, unread_count=0
+        ))
+
+    async def search():
+        async with AsyncSessionLocal() as db:
+            return await search_messages(db, alice, "needle", 10)
+
+    snippets = {}
+    for backend in ("fts5", "like"):
+        monkeypatch.setattr(settings, "SEARCH_BACKEND", backend)
+        snippets[backend] = [hit.snippet for message, hit in run(search())]
+    assert snippets == {"fts5": [content], "like": [content]}
+
+def test_search_status_follows_read_watermarks(database, make_user, run, client):
+    alice, headers = make_user("alice@example.com")
+    bob, _ = make_user("bob@example.com")
+    conversation_id = direct_conversation_id(alice, bob)
+    with database.connect() as conn:
+        run_migrations(conn)
+        conn.commit()
+    with database.begin() as conn:
+        conn.execute(Message.__table__.insert(), [
+            {
+                "id": message_id, "sender_id": alice, "receiver_id": bob, "conversation_id": conversation_id,
+                "content": f"needle {message_id}", "status": MessageStatus.SENT,
+                "created_at": datetime(2024, 1, 1, 10, minute)
+            }
+            for minute, message_id in enumerate(["read", "unread"])
+        ])
+        conn.execute(Conversation.__table__.insert().values(
+            user_id=alice, conversation_id=conversation_id, peer_id=bob, unread_count=0
+        ))
+        # Bob has read up to the first message; the rows still say SENT
+        conn.execute(ReadWatermark.__table__.insert().values(
+            user_id=bob, conversation_id=conversation_id, read_up_to=datetime(2024, 1, 1, 10, 0)
+        ))
+
+    async def search():
+        async with client() as http:
+            return await http.get("/chat/search", params={"q": "needle"}, headers=headers)
+
+    response = run(search())
+    assert response.status_code == 200
+    statuses = {result["message"]["id"]: result["message"]["status"] for result in response.json()["results"]}
+    assert statuses == {"read": "read", "unread": "sent"}
@@ -119,7 +119,7 @@ export const WebSocketProvider: React.FC<WebSocketProviderProps> = ({ children }
         ws.onmessage = (event) => {
           try {
             const data = JSON.parse(event.data);
-            handleWebSocketMessage(data);
+            handleWebSocketMessage(data, ws);
           } catch (e) {
             console.error('Error parsing WebSocket message:', e);
           }
@@ -160,8 +160,12 @@ export const WebSocketProvider: React.FC<WebSocketProviderProps> = ({ children }
   }, [isAuthenticated, token, user, connectWebSocket, socket]);
   
   // Handle incoming WebSocket messages
-  const handleWebSocketMessage = (data: any) => {
+  const handleWebSocketMessage = (data: any, ws: WebSocket) => {
     switch (data.type) {
+      case 'ping':
+        // Heartbeat: the server closes sessions that stay silent too long
+        ws.send(JSON.stringify({ type: 'pong', data: {} }));
+        break;
       case 'message':
         setMessages((prevMessages) => {
           // Check if message already exists to avoid duplicates